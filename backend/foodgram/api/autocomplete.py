@@ -0,0 +1,62 @@
+import bisect
+import threading
+import time
+
+from django.conf import settings
+from recipes.models import Ingredient
+
+
+class IngredientIndex:
+    """
+    Отсортированный индекс ингредиентов в памяти процесса
+    для автодополнения по названию без запросов к базе.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.data = None
+
+    def invalidate(self):
+        """ Индекс будет перестроен при следующем поиске. """
+        self.data = None
+
+    def load(self):
+        data = self.data
+        if data is not None and (
+                time.monotonic() - data[2] < settings.INGREDIENT_INDEX_TTL):
+            return data
+        with self.lock:
+            if self.data is data:
+                rows = sorted(
+                    Ingredient.objects.values(
+                        'id', 'name', 'measurement_unit'),
+                    key=lambda row: (row['name'].casefold(), row['id']))
+                self.data = (
+                    [row['name'].casefold() for row in rows],
+                    rows,
+                    time.monotonic(),
+                )
+            return self.data
+
+    def search(self, value, limit=None):
+        """
+        Сначала ингредиенты, название которых начинается с value,
+        затем содержащие value внутри названия.
+        """
+        limit = limit or settings.INGREDIENT_SEARCH_LIMIT
+        keys, rows, _ = self.load()
+        value = value.casefold()
+        result = []
+        position = bisect.bisect_left(keys, value)
+        while (position < len(keys) and len(result) < limit
+               and keys[position].startswith(value)):
+            result.append(rows[position])
+            position += 1
+        for key, row in zip(keys, rows):
+            if len(result) >= limit:
+                break
+            if value in key and not key.startswith(value):
+                result.append(row)
+        return result
+
+
+ingredient_index = IngredientIndex()
@@ -0,0 +1,97 @@
+import hashlib
+
+from django.core.cache import cache
+from django.db import transaction
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response, patch_vary_headers
+
+
+def version_key(namespace):
+    return f'api:version:{namespace}'
+
+
+def get_version(namespace):
+    """ Текущая версия набора данных, хранится без срока жизни. """
+    key = version_key(namespace)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, 1, timeout=None)
+        version = cache.get(key, 1)
+    return version
+
+
+def bump_version(namespace):
+    """ Новая версия делает недействительными все ответы из кэша. """
+    key = version_key(namespace)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, 2, timeout=None)
+
+
+def bump_version_on_commit(namespace):
+    """
+    Новая версия после коммита: иначе запрос, пришедший до коммита,
+    закэширует старые данные уже под новой версией.
+    """
+    transaction.on_commit(lambda: bump_version(namespace))
+
+
+def bump_count_version(model):
+    """ Сброс закэшированных счетчиков списков модели после коммита. """
+    bump_version_on_commit(f'counts:{model._meta.label_lower}')
+
+
+def recipe_cache_key(recipe_id, version=None):
+    """ Ключ общей для всех пользователей части рецепта. """
+    if version is None:
+        version = get_version('recipes')
+    return f'api:recipe:{version}:{recipe_id}'
+
+
+def invalidate_recipes(recipe_ids):
+    """ Удаление рецептов из кэша после завершения транзакции. """
+    recipe_ids = list(recipe_ids)
+    transaction.on_commit(lambda: cache.delete_many(
+        [recipe_cache_key(recipe_id) for recipe_id in recipe_ids]))
+
+
+class VersionedCacheMixin:
+    """
+    Кэширует JSON-ответы на GET-запросы по версии набора данных
+    cache_namespace, отдает сильный ETag и 304 на If-None-Match.
+    """
+    cache_namespace = None
+
+    def get_response_cache_key(self, request):
+        accept = request.META.get('HTTP_ACCEPT', '')
+        return 'api:response:{}:{}:{}'.format(
+            self.cache_namespace,
+            get_version(self.cache_namespace),
+            hashlib.md5(
+                f'{request.get_full_path()}|{accept}'.encode()).hexdigest())
+
+    def dispatch(self, request, *args, **kwargs):
+        if request.method != 'GET':
+            return super().dispatch(request, *args, **kwargs)
+        key = self.get_response_cache_key(request)
+        cached = cache.get(key)
+        if cached is None:
+            response = super().dispatch(request, *args, **kwargs)
+            renderer = getattr(response, 'accepted_renderer', None)
+            if (response.status_code != 200 or renderer is None
+                    or renderer.format != 'json'):
+                return response
+            response.render()
+            cached = (
+                response.content,
+                response['Content-Type'],
+                '"{}"'.format(hashlib.md5(response.content).hexdigest()),
+            )
+            cache.set(key, cached)
+        content, content_type, etag = cached
+        response = HttpResponse(content, content_type=content_type)
+        response['ETag'] = etag
+        patch_vary_headers(response, ('Accept', ))
+        return get_conditional_response(
+            request, etag=etag, response=response) or response
@@ -0,0 +1,171 @@
+import hashlib
+import hmac
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from api.renderers import (ShoppingListCSVRenderer, ShoppingListPDFRenderer,
+                           ShoppingListTextRenderer)
+from django.conf import settings
+
+RENDERERS = {
+    renderer.format: renderer
+    for renderer in (ShoppingListPDFRenderer,
+                     ShoppingListTextRenderer,
+                     ShoppingListCSVRenderer)
+}
+PENDING_SUFFIX = '.pending'
+FAILED_SUFFIX = '.failed'
+
+logger = logging.getLogger(__name__)
+# время последней очистки каталога в этом процессе
+last_prune = 0
+
+executor = ThreadPoolExecutor(
+    max_workers=settings.EXPORT_WORKERS,
+    thread_name_prefix='shopping-list-export')
+
+
+def get_job_id(rows, file_format, user_id):
+    """
+    Id задания — id владельца и HMAC содержимого списка покупок
+    и формата: для неизменной корзины файл строится один раз,
+    а по угаданному содержимому чужой id не вычислить.
+    """
+    content = json.dumps(rows, ensure_ascii=False, sort_keys=True)
+    digest = hmac.new(
+        settings.SECRET_KEY.encode(),
+        f'{user_id}:{file_format}:{content}'.encode(),
+        hashlib.sha256).hexdigest()
+    return f'{user_id}-{digest}.{file_format}'
+
+
+def get_owner_id(job_id):
+    return int(job_id.split('-', 1)[0])
+
+
+def get_path(job_id):
+    return settings.EXPORT_DIR / job_id
+
+
+def get_pending_path(job_id):
+    return settings.EXPORT_DIR / f'{job_id}{PENDING_SUFFIX}'
+
+
+def get_failed_path(job_id):
+    return settings.EXPORT_DIR / f'{job_id}{FAILED_SUFFIX}'
+
+
+def get_status(job_id):
+    """
+    ready — файл готов, pending — задание в очереди, failed — ошибка,
+    None — нет задания. Зависшее задание (например, воркер перезапущен)
+    ставится заново, упавшее — только повторным enqueue.
+    """
+    if get_path(job_id).exists():
+        return 'ready'
+    if get_failed_path(job_id).exists():
+        return 'failed'
+    pending_path = get_pending_path(job_id)
+    try:
+        started = pending_path.stat().st_mtime
+    except FileNotFoundError:
+        return None
+    if time.time() - started > settings.EXPORT_JOB_TIMEOUT:
+        pending_path.touch()
+        executor.submit(run_job, job_id)
+    return 'pending'
+
+
+def open_file(path):
+    """
+    Открытый файл выгрузки или None, если его нет (например, удален
+    очисткой). Время изменения обновляется, чтобы очистка не удалила
+    используемый файл; уже открытый файл можно отдать и после удаления.
+    """
+    try:
+        file = open(path, 'rb')
+    except FileNotFoundError:
+        return None
+    try:
+        os.utime(path)
+    except FileNotFoundError:
+        pass
+    return file
+
+
+def enqueue(rows, file_format, user_id):
+    """
+    Задание хранится в файле <id>.pending вместе с данными
+    и выполняется пулом потоков текущего процесса.
+    """
+    job_id = get_job_id(rows, file_format, user_id)
+    if get_path(job_id).exists():
+        return job_id
+    settings.EXPORT_DIR.mkdir(parents=True, exist_ok=True)
+    get_failed_path(job_id).unlink(missing_ok=True)
+    try:
+        with open(get_pending_path(job_id), 'x', encoding='utf-8') as file:
+            json.dump(rows, file, ensure_ascii=False)
+    except FileExistsError:
+        return job_id
+    executor.submit(run_job, job_id)
+    return job_id
+
+
+def run_job(job_id):
+    """
+    Ошибка записывается в лог и в файл <id>.failed, иначе она
+    потерялась бы в future пула, а задание ставилось бы заново.
+    """
+    pending_path = get_pending_path(job_id)
+    try:
+        with open(pending_path, encoding='utf-8') as file:
+            rows = json.load(file)
+        file_format = job_id.rsplit('.', 1)[1]
+        write_file(get_path(job_id), RENDERERS[file_format]().render(rows))
+    except Exception as error:
+        logger.exception('Не удалось выгрузить список покупок %s', job_id)
+        get_failed_path(job_id).write_text(str(error), encoding='utf-8')
+    finally:
+        pending_path.unlink(missing_ok=True)
+
+
+def write_file(path, content):
+    """ Запись через временный файл, чтобы не отдать его недописанным. """
+    settings.EXPORT_DIR.mkdir(parents=True, exist_ok=True)
+    temp_path = path.with_name(
+        f'{path.name}.{os.getpid()}.{threading.get_ident()}.tmp')
+    temp_path.write_bytes(content)
+    os.replace(temp_path, path)
+    maybe_prune()
+
+
+def prune(max_age=None):
+    """ Удаление файлов выгрузок старше max_age секунд, их число. """
+    if max_age is None:
+        max_age = settings.EXPORT_MAX_AGE
+    deadline = time.time() - max_age
+    removed = 0
+    for path in settings.EXPORT_DIR.glob('*'):
+        try:
+            if path.is_file() and path.stat().st_mtime < deadline:
+                path.unlink()
+                removed += 1
+        except FileNotFoundError:
+            # файл удалил другой процесс
+            continue
+    return removed
+
+
+def maybe_prune():
+    """ Очистка не чаще раза в EXPORT_PRUNE_INTERVAL секунд. """
+    global last_prune
+    now = time.time()
+    if now - last_prune < settings.EXPORT_PRUNE_INTERVAL:
+        return
+    last_prune = now
+    prune()
@@ -0,0 +1,126 @@
+import base64
+import binascii
+import uuid
+
+from django.conf import settings
+from django.core.files.uploadedfile import TemporaryUploadedFile
+from PIL import Image
+from rest_framework import serializers
+
+# base64-символы, декодируемые за один шаг (кратно 4)
+ENCODED_CHUNK_SIZE = 64 * 1024
+# сколько первых байт файла достаточно для чтения заголовка картинки
+HEADER_SIZE = 256 * 1024
+EXTENSIONS = {'JPEG': 'jpg', 'PNG': 'png', 'GIF': 'gif', 'WEBP': 'webp'}
+# пробельные символы, допустимые в base64 (переносы строк MIME)
+WHITESPACE = ' \t\r\n'
+
+
+def base64_chunks(data, offset):
+    """
+    base64-данные частями по ENCODED_CHUNK_SIZE без пробельных символов.
+    Длина каждой части, кроме последней, кратна 4, поэтому части
+    декодируются независимо.
+    """
+    rest = ''
+    for start in range(offset, len(data), ENCODED_CHUNK_SIZE):
+        chunk = rest + ''.join(
+            data[start:start + ENCODED_CHUNK_SIZE].split())
+        end = len(chunk) // 4 * 4
+        rest = chunk[end:]
+        if end:
+            yield chunk[:end]
+    if rest:
+        yield rest
+
+
+def read_header(file):
+    """
+    Формат и размеры картинки по уже записанному началу файла,
+    None — если заголовок еще не записан целиком.
+    """
+    position = file.tell()
+    file.seek(0)
+    try:
+        with Image.open(file) as image:
+            return image.format, image.size
+    except OSError:
+        return None
+    finally:
+        file.seek(position)
+
+
+class StreamingBase64ImageField(serializers.ImageField):
+    """
+    Картинка в base64 (data URI). Длина строки и размеры картинки
+    проверяются до полного декодирования, данные декодируются
+    частями во временный файл.
+    """
+    default_error_messages = {
+        'invalid_base64': 'Загрузите корректную картинку в base64.',
+        'too_large': 'Размер картинки больше {max_size} байт.',
+        'too_many_pixels': 'Картинка больше {max_pixels} пикселей.',
+        'invalid_format': 'Поддерживаются картинки в форматах {formats}.',
+    }
+
+    def __init__(self, *args, **kwargs):
+        self.max_size = kwargs.pop('max_size', settings.IMAGE_UPLOAD_MAX_SIZE)
+        self.max_pixels = kwargs.pop(
+            'max_pixels', settings.IMAGE_UPLOAD_MAX_PIXELS)
+        super().__init__(*args, **kwargs)
+
+    def get_data_offset(self, data):
+        """ Начало base64-данных без копирования строки. """
+        position = data.find(';base64,', 0, 256)
+        return 0 if position == -1 else position + len(';base64,')
+
+    def check_header(self, header):
+        image_format, (width, height) = header
+        if image_format not in EXTENSIONS:
+            self.fail('invalid_format', formats=', '.join(EXTENSIONS))
+        if width * height > self.max_pixels:
+            self.fail('too_many_pixels', max_pixels=self.max_pixels)
+
+    def decode(self, data, offset):
+        file = TemporaryUploadedFile('image', None, 0, None)
+        header = None
+        try:
+            for chunk in base64_chunks(data, offset):
+                try:
+                    file.write(base64.b64decode(chunk, validate=True))
+                except (binascii.Error, ValueError):
+                    self.fail('invalid_base64')
+                if header is None and file.tell() <= HEADER_SIZE:
+                    header = read_header(file)
+                    if header is not None:
+                        self.check_header(header)
+            file.size = file.tell()
+            header = read_header(file)
+            if header is None:
+                self.fail('invalid_image')
+            self.check_header(header)
+        except (serializers.ValidationError, Image.DecompressionBombError):
+            file.close()
+            raise
+        file.seek(0)
+        file.name = f'{uuid.uuid4()}.{EXTENSIONS[header[0]]}'
+        return file
+
+    def to_internal_value(self, data):
+        if not isinstance(data, str):
+            self.fail('invalid_base64')
+        offset = self.get_data_offset(data)
+        # 4 символа base64 на каждые 3 байта, пробелы не считаются
+        length = len(data) - offset - sum(
+            data.count(char, offset) for char in WHITESPACE)
+        if length // 4 * 3 > self.max_size:
+            self.fail('too_large', max_size=self.max_size)
+        try:
+            file = self.decode(data, offset)
+        except Image.DecompressionBombError:
+            self.fail('too_many_pixels', max_pixels=self.max_pixels)
+        try:
+            return super().to_internal_value(file)
+        except serializers.ValidationError:
+            file.close()
+            raise
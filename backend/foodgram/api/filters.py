@@ -1,13 +1,69 @@
 ﻿import django_filters
-from django.db.models import Q
+from django.contrib.postgres.search import TrigramSimilarity
+from django.db import connection
+from django.db.models import Case, FloatField, Q, Value, When
+from django.db.models.functions import Greatest, Upper
 from django_filters.rest_framework import FilterSet, filters
 from recipes.models import Ingredient, Recipe, Tag, User
+from rest_framework.filters import SearchFilter
+
+FUZZY_PARAM = 'fuzzy'
+
+
+def similarity_search(queryset, fields, value):
+    """
+    Нечеткий поиск, устойчивый к опечаткам, с ранжированием.
+    На PostgreSQL — по триграммам (индексы на UPPER(поле)),
+    на других базах — по вхождению, совпадения по началу выше.
+    """
+    if connection.vendor != 'postgresql':
+        condition = Q()
+        prefix = Q()
+        for field in fields:
+            condition |= Q(**{f'{field}__icontains': value})
+            prefix |= Q(**{f'{field}__istartswith': value})
+        return queryset.filter(condition).annotate(rank=Case(
+            When(prefix, then=Value(1.0)),
+            default=Value(0.0),
+            output_field=FloatField(),
+        )).order_by('-rank', 'pk')
+    value = value.upper()
+    condition = Q()
+    ranks = []
+    for field in fields:
+        upper = f'{field}_upper'
+        queryset = queryset.annotate(**{upper: Upper(field)})
+        condition |= Q(**{f'{upper}__contains': value})
+        condition |= Q(**{f'{upper}__trigram_similar': value})
+        ranks.append(TrigramSimilarity(upper, value))
+    rank = Greatest(*ranks) if len(ranks) > 1 else ranks[0]
+    return queryset.filter(condition).annotate(
+        rank=rank).order_by('-rank', 'pk')
+
+
+def is_fuzzy(data):
+    return data.get(FUZZY_PARAM, '').lower() in ('1', 'true')
+
+
+class SimilaritySearchFilter(SearchFilter):
+    """ Поиск по search_fields, с ?fuzzy=true — нечеткий. """
+    def filter_queryset(self, request, queryset, view):
+        search = request.query_params.get(self.search_param, '').strip()
+        if search and is_fuzzy(request.query_params):
+            return similarity_search(
+                queryset, self.get_search_fields(view, request), search)
+        return super().filter_queryset(request, queryset, view)
 
 
 class IngredientsNameFilter(django_filters.Filter):
-    """ Фильтр для поиска по первым символам названия. """
+    """
+    Фильтр для поиска по первым символам названия,
+    с ?fuzzy=true — нечеткий поиск.
+    """
     def filter(self, qs, value):
         if value:
+            if is_fuzzy(self.parent.data):
+                return similarity_search(qs, ('name',), value)
             return qs.filter(Q(name__istartswith=value))
         return qs
 
@@ -31,10 +87,14 @@ class RecipeFilter(FilterSet):
     is_favorited = filters.BooleanFilter(method='filter_is_favorited')
     is_in_shopping_cart = filters.BooleanFilter(
         method='filter_is_in_shopping_cart')
+    ordering = filters.ChoiceFilter(
+        choices=(('popular', 'По популярности'), ),
+        method='filter_ordering')
 
     class Meta:
         model = Recipe
-        fields = ('tags', 'author', 'is_favorited', 'is_in_shopping_cart')
+        fields = ('tags', 'author', 'is_favorited', 'is_in_shopping_cart',
+                  'ordering')
 
     def filter_is_favorited(self, queryset, name, value):
         if value and self.request.user.is_authenticated:
@@ -47,6 +107,12 @@ class RecipeFilter(FilterSet):
             return queryset.filter(for_cooking__user=user)
         return queryset
 
+    def filter_ordering(self, queryset, name, value):
+        """ Порядок по индексу (-popularity, -id). """
+        if value == 'popular':
+            return queryset.order_by('-popularity', '-id')
+        return queryset
+
 
 class UserFilter(FilterSet):
     """ Фильтр для пользователей. """
@@ -0,0 +1,131 @@
+import json
+import logging
+import random
+import threading
+import time
+from collections import Counter
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from rest_framework import serializers
+
+logger = logging.getLogger(__name__)
+
+local = threading.local()
+
+
+class RequestStats:
+    """ Запросы к базе и время сериализации одного HTTP-запроса. """
+    def __init__(self):
+        self.queries = Counter()
+        self.sql_time = 0
+        self.serializer_time = 0
+        self.serializer_depth = 0
+        self.view = None
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.sql_time += time.perf_counter() - start
+            self.queries[sql] += 1
+
+    def get_repeated(self, threshold):
+        """ Одинаковые по форме запросы — вероятные N+1. """
+        return [(sql, count) for sql, count in self.queries.most_common()
+                if count >= threshold]
+
+
+def timed_data(data):
+    """ Время получения serializer.data, вложенные вызовы не учитываются. """
+    def wrapper(self):
+        stats = getattr(local, 'stats', None)
+        if stats is None:
+            return data.fget(self)
+        stats.serializer_depth += 1
+        start = time.perf_counter()
+        try:
+            return data.fget(self)
+        finally:
+            stats.serializer_depth -= 1
+            if not stats.serializer_depth:
+                stats.serializer_time += time.perf_counter() - start
+    return property(wrapper)
+
+
+def get_view_name(view_func, request):
+    """ Имя вида, для вьюсетов вместе с действием: RecipeViewSet.list. """
+    view_class = getattr(view_func, 'cls', None)
+    if view_class is None:
+        return f'{view_func.__module__}.{view_func.__name__}'
+    action = getattr(view_func, 'actions', {}).get(request.method.lower())
+    if action is None:
+        return view_class.__name__
+    return f'{view_class.__name__}.{action}'
+
+
+class SQLInstrumentationMiddleware:
+    """
+    Число и время SQL-запросов и время сериализации в заголовке
+    Server-Timing и в логе. Включается SQL_INSTRUMENTATION_SAMPLE_RATE,
+    при нулевой доле запросов middleware отключается целиком.
+    """
+    def __init__(self, get_response):
+        self.sample_rate = settings.SQL_INSTRUMENTATION_SAMPLE_RATE
+        if self.sample_rate <= 0:
+            raise MiddlewareNotUsed
+        self.threshold = settings.SQL_N_PLUS_ONE_THRESHOLD
+        self.get_response = get_response
+        for serializer_class in (serializers.Serializer,
+                                 serializers.ListSerializer):
+            if not hasattr(serializer_class, 'untimed_data'):
+                serializer_class.untimed_data = serializer_class.data
+                serializer_class.data = timed_data(serializer_class.data)
+
+    def __call__(self, request):
+        if random.random() >= self.sample_rate:
+            return self.get_response(request)
+        stats = local.stats = RequestStats()
+        start = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(stats))
+                response = self.get_response(request)
+        finally:
+            local.stats = None
+        total_time = time.perf_counter() - start
+        response['Server-Timing'] = ', '.join((
+            f'db;dur={stats.sql_time * 1000:.1f};'
+            f'desc="{sum(stats.queries.values())} queries"',
+            f'serializer;dur={stats.serializer_time * 1000:.1f}',
+            f'total;dur={total_time * 1000:.1f}',
+        ))
+        self.log(request, response, stats, total_time)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        stats = getattr(local, 'stats', None)
+        if stats is not None:
+            stats.view = get_view_name(view_func, request)
+
+    def log(self, request, response, stats, total_time):
+        repeated = stats.get_repeated(self.threshold)
+        logger.info(json.dumps({
+            'method': request.method,
+            'path': request.path,
+            'view': stats.view,
+            'status': response.status_code,
+            'queries': sum(stats.queries.values()),
+            'sql_ms': round(stats.sql_time * 1000, 1),
+            'serializer_ms': round(stats.serializer_time * 1000, 1),
+            'total_ms': round(total_time * 1000, 1),
+            'repeated_queries': len(repeated),
+        }, ensure_ascii=False))
+        for sql, count in repeated:
+            logger.warning(
+                'Possible N+1 in %s: %s identical queries: %s',
+                stats.view, count, sql)
@@ -1,19 +1,151 @@
-﻿from django.conf import settings
-from rest_framework.pagination import PageNumberPagination
+﻿import hashlib
+import json
+
+from api.cache import get_version
+from django.conf import settings
+from django.core.cache import cache
+from django.core.paginator import Paginator
+from django.db import connection
+from django.utils.functional import cached_property
+from rest_framework.pagination import CursorPagination, PageNumberPagination
 from rest_framework.response import Response
 
 
+def estimate_count(model):
+    """ Оценка числа строк таблицы по статистике планировщика PostgreSQL. """
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass',
+            (model._meta.db_table, ))
+        row = cursor.fetchone()
+    return max(row[0], 0) if row else 0
+
+
+class CachedCountPaginator(Paginator):
+    """
+    Paginator, который берет общее число объектов из кэша,
+    а для списков без фильтров на больших таблицах PostgreSQL —
+    из оценки планировщика вместо COUNT(*).
+    """
+    def __init__(self, object_list, per_page, count_key=None,
+                 estimate=False, **kwargs):
+        super().__init__(object_list, per_page, **kwargs)
+        self.count_key = count_key
+        self.estimate = estimate
+        self.count_exact = True
+
+    @cached_property
+    def count(self):
+        if self.estimate:
+            estimated = estimate_count(self.object_list.model)
+            if estimated >= settings.COUNT_ESTIMATE_THRESHOLD:
+                self.count_exact = False
+                return estimated
+        count = cache.get(self.count_key)
+        if count is None:
+            count = self.object_list.count()
+            cache.set(self.count_key, count)
+        return count
+
+
+class IdCursorPagination(CursorPagination):
+    """
+    Пагинация по курсору в порядке -id: следующая страница
+    выбирается условием id < последнего, без OFFSET и COUNT(*).
+    """
+    ordering = '-id'
+    page_size = settings.PAGE_SIZE
+    page_size_query_param = settings.PAGE_SIZE_QUERY_PARAM
+    max_page_size = settings.MAX_PAGE_SIZE
+
+    def decode_cursor(self, request):
+        if not request.query_params.get(self.cursor_query_param):
+            return None
+        return super().decode_cursor(request)
+
+
 class CustomPagination(PageNumberPagination):
     """
-    Класс для пагинации рецептов
+    Класс для пагинации рецептов.
+    С параметром ?cursor (для первой страницы — пустым)
+    включается пагинация по курсору, если список в порядке -id.
     """
     page_size = settings.PAGE_SIZE
     page_size_query_param = settings.PAGE_SIZE_QUERY_PARAM
     max_page_size = settings.MAX_PAGE_SIZE
+    cursor_pagination_class = IdCursorPagination
+    # фильтры и действия, результат которых зависит от пользователя
+    user_filter_params = ('is_favorited', 'is_in_shopping_cart')
+    user_actions = ('subscriptions', )
+
+    def get_filter_params(self, request):
+        ignored = {
+            self.page_query_param,
+            self.page_size_query_param,
+            self.cursor_pagination_class.cursor_query_param,
+            'format',
+            'ordering',
+        }
+        return sorted(
+            (key, sorted(values))
+            for key, values in request.query_params.lists()
+            if key not in ignored)
+
+    def depends_on_user(self, request):
+        """ Зависит ли список от текущего пользователя. """
+        if getattr(self.view, 'action', None) in self.user_actions:
+            return True
+        return any(
+            request.query_params.get(param) in ('1', 'true', 'True')
+            for param in self.user_filter_params)
+
+    def get_count_key(self, queryset, request):
+        """
+        Ключ счетчика: модель и ее версия, путь, фильтры и пользователь,
+        если от него зависит список. Без таких фильтров счетчик общий
+        для всех пользователей.
+        """
+        namespace = f'counts:{queryset.model._meta.label_lower}'
+        params = json.dumps([
+            request.path,
+            request.user.id if self.depends_on_user(request) else None,
+            self.get_filter_params(request),
+        ])
+        return 'api:count:{}:{}:{}'.format(
+            namespace,
+            get_version(namespace),
+            hashlib.md5(params.encode()).hexdigest())
+
+    def django_paginator_class(self, queryset, page_size):
+        estimate = (
+            settings.COUNT_ESTIMATE_THRESHOLD > 0
+            and connection.vendor == 'postgresql'
+            and getattr(self.view, 'action', None) == 'list'
+            and not self.get_filter_params(self.request))
+        return CachedCountPaginator(
+            queryset, page_size,
+            count_key=self.get_count_key(queryset, self.request),
+            estimate=estimate)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.view = view
+        self.cursor_paginator = None
+        if (self.cursor_pagination_class.cursor_query_param
+                in request.query_params
+                and tuple(queryset.query.order_by) == (
+                    self.cursor_pagination_class.ordering, )):
+            self.cursor_paginator = self.cursor_pagination_class()
+            return self.cursor_paginator.paginate_queryset(
+                queryset, request, view)
+        return super().paginate_queryset(queryset, request, view)
 
     def get_paginated_response(self, data):
+        if self.cursor_paginator is not None:
+            return self.cursor_paginator.get_paginated_response(data)
         return Response({
             'count': self.page.paginator.count,
+            'count_exact': self.page.paginator.count_exact,
             'next': self.get_next_link(),
             'previous': self.get_previous_link(),
             'results': data
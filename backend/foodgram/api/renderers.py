@@ -0,0 +1,104 @@
+import csv
+import io
+
+from django.conf import settings
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.utils import simpleSplit
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.pdfgen import canvas
+from rest_framework.renderers import BaseRenderer
+
+FONT_NAME = 'DejaVuSans'
+FONT_SIZE = 18
+LINE_HEIGHT = 20
+MARGIN = 50
+TOP = 750
+TITLE = 'СПИСОК ПОКУПОК:'
+LINE = '- {item}:  {amount} {unit}'
+
+
+def register_fonts():
+    """ Шрифт с кириллицей читается один раз при запуске. """
+    if FONT_NAME not in pdfmetrics.getRegisteredFontNames():
+        pdfmetrics.registerFont(
+            TTFont(FONT_NAME, str(settings.BASE_DIR / 'DejaVuSans.ttf')))
+
+
+class ShoppingListRenderer(BaseRenderer):
+    """
+    Базовый класс для выгрузки списка покупок.
+    data — строки ingredient__name, ingredient__measurement_unit, amount,
+    либо словарь с описанием ошибки.
+    """
+    def get_lines(self, data):
+        if isinstance(data, dict):
+            return [str(value) for value in data.values()]
+        return [
+            LINE.format(
+                item=row['ingredient__name'],
+                amount=row['amount'],
+                unit=row['ingredient__measurement_unit'])
+            for row in data
+        ]
+
+
+class ShoppingListPDFRenderer(ShoppingListRenderer):
+    """ Список покупок в pdf с переносом на новые страницы. """
+    media_type = 'application/pdf'
+    format = 'pdf'
+    charset = None
+    render_style = 'binary'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        register_fonts()
+        buffer = io.BytesIO()
+        width = A4[0]
+        pdf_canvas = canvas.Canvas(buffer, pagesize=A4)
+        pdf_canvas.setFont(FONT_NAME, FONT_SIZE)
+        y = TOP
+        pdf_canvas.drawString(MARGIN, y, TITLE)
+        y -= LINE_HEIGHT
+        for line in self.get_lines(data):
+            for part in simpleSplit(
+                    line, FONT_NAME, FONT_SIZE, width - 2 * MARGIN):
+                y -= LINE_HEIGHT
+                if y < MARGIN:
+                    pdf_canvas.showPage()
+                    pdf_canvas.setFont(FONT_NAME, FONT_SIZE)
+                    y = TOP
+                pdf_canvas.drawString(MARGIN, y, part)
+        pdf_canvas.showPage()
+        pdf_canvas.save()
+        return buffer.getvalue()
+
+
+class ShoppingListTextRenderer(ShoppingListRenderer):
+    """ Список покупок простым текстом. """
+    media_type = 'text/plain'
+    format = 'txt'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        lines = self.get_lines(data)
+        if not isinstance(data, dict):
+            lines.insert(0, TITLE)
+        return '\n'.join([*lines, '']).encode(self.charset)
+
+
+class ShoppingListCSVRenderer(ShoppingListRenderer):
+    """ Список покупок в csv: название, количество, единица. """
+    media_type = 'text/csv'
+    format = 'csv'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        if isinstance(data, dict):
+            writer.writerows([line] for line in self.get_lines(data))
+        else:
+            writer.writerow(('name', 'amount', 'measurement_unit'))
+            writer.writerows(
+                (row['ingredient__name'], row['amount'],
+                 row['ingredient__measurement_unit'])
+                for row in data)
+        return buffer.getvalue().encode(self.charset)
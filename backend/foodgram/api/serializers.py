@@ -1,10 +1,54 @@
-﻿import webcolors
+﻿from collections import Counter, defaultdict
+
+import webcolors
+from api.cache import get_version, recipe_cache_key
+from api.fields import StreamingBase64ImageField
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Manager, prefetch_related_objects
 from drf_extra_fields.fields import Base64ImageField
-from recipes.models import (Favorites, Ingredient, MyShoppingCart, Recipe,
-                            RecipeIngredient, Subscribtions, Tag, User)
+from recipes.images import get_variants
+from recipes.models import (AuthorStats, Favorites, Ingredient, MyShoppingCart,
+                            Recipe, RecipeIngredient, Subscribtions, Tag, User)
 from rest_framework import serializers
 
 
+def resolve_ids(model, ids):
+    """
+    Объекты по списку id одним запросом
+    и сообщения обо всех неизвестных и повторяющихся id.
+    """
+    objects = model.objects.in_bulk(set(ids))
+    errors = []
+    unknown = sorted(set(ids) - objects.keys())
+    if unknown:
+        errors.append(f'Несуществующие id: {", ".join(map(str, unknown))}.')
+    duplicates = sorted(id for id, count in Counter(ids).items() if count > 1)
+    if duplicates:
+        errors.append(
+            f'Повторяющиеся id: {", ".join(map(str, duplicates))}.')
+    return objects, errors
+
+
+def get_recipes_count(author):
+    """ Число рецептов из счетчиков автора, без COUNT(*). """
+    try:
+        return author.stats.recipes_count
+    except AuthorStats.DoesNotExist:
+        return 0
+
+
+def get_subscribed_ids(request):
+    """
+    Id авторов, на которых подписан пользователь.
+    Загружаются один раз за запрос.
+    """
+    if not hasattr(request, 'subscribed_ids'):
+        request.subscribed_ids = set(Subscribtions.objects.filter(
+            user=request.user).values_list('author_id', flat=True))
+    return request.subscribed_ids
+
+
 class NameToHexColor(serializers.Field):
     """ Класс для перевода именованных цветов в 16-е представление. """
     def to_representation(self, value):
@@ -50,6 +94,14 @@ class RecipeIngredientSerializer(serializers.ModelSerializer):
         fields = ('id', 'name', 'measurement_unit', 'amount',)
 
 
+class RecipeIngredientWriteSerializer(RecipeIngredientSerializer):
+    """
+    Ингредиенты создаваемого рецепта. Id проверяются
+    одним запросом в RecipeCreateSerializer.
+    """
+    id = serializers.IntegerField()
+
+
 class UserCreateSerializer(serializers.ModelSerializer):
     """ Сериализатор для создания пользователя. """
 
@@ -87,11 +139,12 @@ class AuthorSerializer(serializers.ModelSerializer):
                   'is_subscribed')
 
     def get_is_subscribed(self, instance):
-        user = self.context.get('request').user
-        if user.is_anonymous:
+        if hasattr(instance, 'is_subscribed'):
+            return instance.is_subscribed
+        request = self.context.get('request')
+        if request is None or request.user.is_anonymous:
             return False
-        return Subscribtions.objects.filter(
-            user=user, author=instance.id).exists()
+        return instance.id in get_subscribed_ids(request)
 
 
 class AuthorWithRecipesSerializer(AuthorSerializer):
@@ -113,7 +166,7 @@ class AuthorWithRecipesSerializer(AuthorSerializer):
                                      many=True).data
 
     def get_recipes_count(self, instance):
-        return instance.recipe_set.all().count()
+        return get_recipes_count(instance)
 
 
 class FavoritesSerializer(serializers.ModelSerializer):
@@ -152,6 +205,29 @@ class ShoppingCartSerializer(serializers.ModelSerializer):
         ).data
 
 
+class RecipeListSerializer(serializers.ListSerializer):
+    """
+    Список рецептов: общие части читаются из кэша одним запросом,
+    связи подгружаются из базы только для отсутствующих в кэше.
+    """
+    def to_representation(self, data):
+        recipes = list(data.all() if isinstance(data, Manager) else data)
+        version = get_version('recipes')
+        keys = {
+            recipe.id: recipe_cache_key(recipe.id, version)
+            for recipe in recipes
+        }
+        cached = cache.get_many(keys.values())
+        prefetch_related_objects(
+            [recipe for recipe in recipes if keys[recipe.id] not in cached],
+            'recipe_ingredients__ingredient', 'tags')
+        return [
+            self.child.represent(
+                recipe, cached.get(keys[recipe.id]), variant='card')
+            for recipe in recipes
+        ]
+
+
 class RecipeSerializer(serializers.ModelSerializer):
     """ Сериализатор рецептов. """
     tags = TagSerializer(many=True)
@@ -160,12 +236,58 @@ class RecipeSerializer(serializers.ModelSerializer):
     is_favorited = serializers.SerializerMethodField()
     is_in_shopping_cart = serializers.SerializerMethodField()
     image = Base64ImageField(max_length=None)
+    images = serializers.SerializerMethodField()
 
     class Meta:
         model = Recipe
         fields = ('tags', 'id', 'ingredients', 'author',
-                  'is_favorited', 'image', 'is_in_shopping_cart',
+                  'is_favorited', 'image', 'images', 'is_in_shopping_cart',
                   'name', 'text', 'cooking_time')
+        list_serializer_class = RecipeListSerializer
+
+    def to_representation(self, instance):
+        return self.represent(
+            instance, cache.get(recipe_cache_key(instance.id)))
+
+    def get_absolute_url(self, url):
+        request = self.context.get('request')
+        if url and request is not None:
+            return request.build_absolute_uri(url)
+        return url
+
+    def get_images(self, obj):
+        """ Уменьшенные копии картинки: card, detail и их WebP. """
+        return get_variants(obj)
+
+    def set_image_variant(self, data, variant):
+        """ В image — копия картинки для карточки или страницы рецепта. """
+        data['images'] = {
+            name: self.get_absolute_url(url)
+            for name, url in data['images'].items()
+        }
+        data['image'] = data['images'].get(
+            variant, self.get_absolute_url(data['image']))
+
+    def represent(self, instance, public, variant='detail'):
+        """
+        Общая для всех часть рецепта берется из кэша,
+        пометки текущего пользователя накладываются поверх.
+        """
+        if hasattr(instance, 'author_is_subscribed'):
+            instance.author.is_subscribed = instance.author_is_subscribed
+        if public is None:
+            prefetch_related_objects(
+                [instance], 'recipe_ingredients__ingredient', 'tags')
+            public = super().to_representation(instance)
+            public['image'] = instance.image.url if instance.image else None
+            cache.set(recipe_cache_key(instance.id), public)
+        self.set_image_variant(public, variant)
+        public['is_favorited'] = self.get_is_favorited(instance)
+        public['is_in_shopping_cart'] = self.get_is_in_shopping_cart(
+            instance)
+        public['author']['is_subscribed'] = self.fields[
+            'author'].get_is_subscribed(instance.author)
+        return public
 
     def get_ingredients(self, instance):
         return RecipeIngredientSerializer(
@@ -175,6 +297,8 @@ class RecipeSerializer(serializers.ModelSerializer):
 
     def get_is_favorited(self, obj):
         """ Проверка рецепта в списке избранного. """
+        if hasattr(obj, 'is_favorited'):
+            return obj.is_favorited
         user = self.context.get('request').user
         if user.is_anonymous:
             return False
@@ -184,6 +308,8 @@ class RecipeSerializer(serializers.ModelSerializer):
 
     def get_is_in_shopping_cart(self, obj):
         """ Проверка рецепта в корзине покупок. """
+        if hasattr(obj, 'is_in_shopping_cart'):
+            return obj.is_in_shopping_cart
         user = self.context.get('request').user
         if not user or user.is_anonymous:
             return False
@@ -197,18 +323,22 @@ class RecipeShortSerializer(RecipeSerializer):
 
     class Meta:
         model = Recipe
-        fields = ('id', 'name', 'image', 'cooking_time')
+        fields = ('id', 'name', 'image', 'images', 'cooking_time')
+
+    def to_representation(self, instance):
+        data = serializers.ModelSerializer.to_representation(self, instance)
+        data['image'] = instance.image.url if instance.image else None
+        self.set_image_variant(data, 'card')
+        return data
 
 
 class RecipeCreateSerializer(serializers.ModelSerializer):
     """ Сериализатор для создания рецептов. """
-    tags = serializers.PrimaryKeyRelatedField(
-        many=True,
-        queryset=Tag.objects.all())
-    ingredients = RecipeIngredientSerializer(
+    tags = serializers.ListField(child=serializers.IntegerField())
+    ingredients = RecipeIngredientWriteSerializer(
         many=True,)
     author = serializers.SerializerMethodField()
-    image = Base64ImageField(max_length=None)
+    image = StreamingBase64ImageField()
 
     class Meta:
         model = Recipe
@@ -216,6 +346,23 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
                   'ingredients', 'name', 'image',
                   'text', 'cooking_time')
 
+    def validate(self, data):
+        """ Теги и ингредиенты загружаются одним запросом на модель. """
+        errors = {}
+        if 'tags' in data:
+            tags, errors['tags'] = resolve_ids(Tag, data['tags'])
+            data['tags'] = [tags.get(id) for id in data['tags']]
+        if 'ingredients' in data:
+            ingredients, errors['ingredients'] = resolve_ids(
+                Ingredient,
+                [ingredient['id'] for ingredient in data['ingredients']])
+            for ingredient in data['ingredients']:
+                ingredient['id'] = ingredients.get(ingredient['id'])
+        errors = {field: error for field, error in errors.items() if error}
+        if errors:
+            raise serializers.ValidationError(errors)
+        return data
+
     @staticmethod
     def create_ingredients_list(recipe, ingredients_data):
         ingredient_list = [
@@ -225,6 +372,41 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
                 recipe=recipe) for ingredient_data in ingredients_data]
         RecipeIngredient.objects.bulk_create(ingredient_list)
 
+    @staticmethod
+    def update_ingredients_list(recipe, ingredients_data):
+        """
+        Изменяются только отличающиеся строки: существующие
+        сопоставляются с новыми по ингредиенту.
+        """
+        existing = defaultdict(list)
+        for recipe_ingredient in RecipeIngredient.objects.filter(
+                recipe=recipe).order_by('id'):
+            existing[recipe_ingredient.ingredient_id].append(
+                recipe_ingredient)
+        to_create, to_update = [], []
+        for ingredient_data in ingredients_data:
+            ingredient = ingredient_data['id']
+            amount = ingredient_data['amount']
+            if not existing[ingredient.id]:
+                to_create.append(RecipeIngredient(
+                    ingredient=ingredient, amount=amount, recipe=recipe))
+                continue
+            recipe_ingredient = existing[ingredient.id].pop(0)
+            if recipe_ingredient.amount != amount:
+                recipe_ingredient.amount = amount
+                to_update.append(recipe_ingredient)
+        to_delete = [
+            recipe_ingredient.id
+            for recipe_ingredients in existing.values()
+            for recipe_ingredient in recipe_ingredients]
+        if to_delete:
+            RecipeIngredient.objects.filter(id__in=to_delete).delete()
+        if to_update:
+            RecipeIngredient.objects.bulk_update(to_update, ('amount', ))
+        if to_create:
+            RecipeIngredient.objects.bulk_create(to_create)
+
+    @transaction.atomic
     def create(self, validated_data):
         ingredients_data = validated_data.pop('ingredients')
         tags_data = validated_data.pop('tags')
@@ -233,14 +415,24 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
         self.create_ingredients_list(recipe, ingredients_data)
         return recipe
 
+    @transaction.atomic
     def update(self, instance, validated_data):
-        instance.tags.clear()
-        instance.tags.set(validated_data.pop('tags'))
-        RecipeIngredient.objects.filter(recipe=instance).delete()
-        ingredients_data = validated_data.pop('ingredients')
-        self.create_ingredients_list(instance, ingredients_data)
+        if 'tags' in validated_data:
+            instance.tags.set(validated_data.pop('tags'))
+        if 'ingredients' in validated_data:
+            self.update_ingredients_list(
+                instance, validated_data.pop('ingredients'))
         return super().update(instance, validated_data)
 
+    def save(self, **kwargs):
+        """ Временный файл картинки закрывается сразу после сохранения. """
+        try:
+            return super().save(**kwargs)
+        finally:
+            image = self.validated_data.get('image')
+            if image is not None:
+                image.close()
+
     def get_author(self, instance):
         return AuthorSerializer(instance.author).data
 
@@ -288,12 +480,15 @@ class SubscribeSerializer(serializers.ModelSerializer):
         return data
 
     def get_is_subscribed(self, obj):
-        """ Проверка подписки. """
-        return Subscribtions.objects.filter(
-            user=obj.user, author=obj.author).exists()
+        """ Проверка подписки: obj сам является подпиской. """
+        return True
 
     def get_recipes(self, obj):
         """ Получение рецептов автора. """
+        recipes_by_author = self.context.get('recipes')
+        if recipes_by_author is not None:
+            return RecipeShortSerializer(
+                recipes_by_author[obj.author_id], many=True).data
         request = self.context.get('request')
         recipes_limit = request.GET.get('recipes_limit')
         recipes = Recipe.objects.filter(author=obj.author)
@@ -304,4 +499,4 @@ class SubscribeSerializer(serializers.ModelSerializer):
 
     def get_recipes_count(self, obj):
         """ Подсчет рецептов автора. """
-        return Recipe.objects.filter(author=obj.author).count()
+        return get_recipes_count(obj.author)
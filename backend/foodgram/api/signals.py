@@ -0,0 +1,96 @@
+from api.autocomplete import ingredient_index
+from api.cache import (bump_count_version, bump_version_on_commit,
+                       invalidate_recipes)
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+from recipes.images import derivatives_created
+from recipes.models import (Favorites, Ingredient, MyShoppingCart, Recipe,
+                            RecipeIngredient, Subscribtions, Tag, User)
+
+AUTHOR_FIELDS = {'email', 'username', 'first_name', 'last_name'}
+
+
+@receiver((post_save, post_delete), sender=Ingredient)
+def invalidate_ingredient_index(**kwargs):
+    """
+    Сброс индекса автодополнения после коммита, чтобы индекс
+    не перестроился из старых строк.
+    """
+    transaction.on_commit(ingredient_index.invalidate)
+
+
+@receiver((post_save, post_delete), sender=Ingredient)
+def bump_ingredients_version(**kwargs):
+    """ Сброс кэша ответов IngredientViewSet. """
+    bump_version_on_commit('ingredients')
+
+
+@receiver((post_save, post_delete), sender=Tag)
+def bump_tags_version(**kwargs):
+    """ Сброс кэша ответов TagViewSet. """
+    bump_version_on_commit('tags')
+
+
+@receiver((post_save, post_delete), sender=Ingredient)
+@receiver((post_save, post_delete), sender=Tag)
+def bump_recipes_version(**kwargs):
+    """ Тег или ингредиент может входить в любой рецепт. """
+    bump_version_on_commit('recipes')
+
+
+@receiver((post_save, post_delete), sender=Recipe)
+def invalidate_recipe(instance, **kwargs):
+    invalidate_recipes((instance.id, ))
+
+
+@receiver((post_save, post_delete), sender=RecipeIngredient)
+def invalidate_recipe_ingredients(instance, **kwargs):
+    invalidate_recipes((instance.recipe_id, ))
+
+
+@receiver(derivatives_created)
+def invalidate_recipe_images(recipe_ids, **kwargs):
+    invalidate_recipes(recipe_ids)
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def invalidate_recipe_tags(instance, action, reverse, pk_set, **kwargs):
+    if not action.startswith('post_'):
+        return
+    if not reverse:
+        invalidate_recipes((instance.id, ))
+    elif pk_set:
+        invalidate_recipes(pk_set)
+    else:
+        bump_version_on_commit('recipes')
+
+
+@receiver(post_save, sender=User)
+def invalidate_author_recipes(instance, update_fields, **kwargs):
+    """ Профиль автора входит в каждый его рецепт. """
+    if update_fields is not None and not AUTHOR_FIELDS & set(update_fields):
+        return
+    invalidate_recipes(
+        Recipe.objects.filter(author=instance).values_list('id', flat=True))
+
+
+@receiver((post_save, post_delete), sender=Recipe)
+@receiver((post_save, post_delete), sender=Favorites)
+@receiver((post_save, post_delete), sender=MyShoppingCart)
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def bump_recipe_counts(**kwargs):
+    """ Число рецептов в списках с фильтрами могло измениться. """
+    bump_count_version(Recipe)
+
+
+@receiver((post_save, post_delete), sender=Subscribtions)
+def bump_subscription_counts(**kwargs):
+    bump_count_version(Subscribtions)
+
+
+@receiver((post_save, post_delete), sender=User)
+def bump_user_counts(update_fields=None, **kwargs):
+    if update_fields is not None and not AUTHOR_FIELDS & set(update_fields):
+        return
+    bump_count_version(User)
@@ -0,0 +1,99 @@
+import base64
+import io
+import tempfile
+from pathlib import Path
+from types import SimpleNamespace
+from unittest import mock
+
+from api import exports, fields
+from api.fields import StreamingBase64ImageField
+from api.pagination import CustomPagination
+from django.conf import settings
+from django.test import TestCase, override_settings
+from PIL import Image
+from recipes.models import Recipe, User
+from rest_framework.request import Request
+from rest_framework.test import APIClient, APIRequestFactory
+
+
+class ShoppingCartExportTest(TestCase):
+    """ Выгрузки списка покупок доступны только владельцу. """
+
+    def setUp(self):
+        export_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(export_dir.cleanup)
+        export_settings = override_settings(
+            EXPORT_DIR=Path(export_dir.name))
+        export_settings.enable()
+        self.addCleanup(export_settings.disable)
+        self.owner = User.objects.create(username='owner', email='o@o.ru')
+        self.other = User.objects.create(username='other', email='x@x.ru')
+        self.client = APIClient()
+
+    def test_result_hidden_from_other_users(self):
+        self.client.force_authenticate(self.owner)
+        response = self.client.post(
+            '/api/recipes/shopping_cart_export/', {'format': 'txt'})
+        url = response.data['url']
+        self.assertNotEqual(self.client.get(url).status_code, 404)
+        self.client.force_authenticate(self.other)
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+    def test_job_id_depends_on_user(self):
+        self.assertNotEqual(
+            exports.get_job_id([], 'txt', self.owner.id),
+            exports.get_job_id([], 'txt', self.other.id))
+
+    def test_download_after_file_removed(self):
+        self.client.force_authenticate(self.owner)
+        url = '/api/recipes/download_shopping_cart/?format=txt'
+        self.assertEqual(self.client.get(url).status_code, 200)
+        for path in settings.EXPORT_DIR.iterdir():
+            path.unlink()
+        self.assertEqual(self.client.get(url).status_code, 200)
+
+
+class CountKeyTest(TestCase):
+    """ Счетчик списка общий, пока список не зависит от пользователя. """
+
+    def setUp(self):
+        self.first = User.objects.create(username='first', email='f@f.ru')
+        self.second = User.objects.create(username='second', email='s@s.ru')
+
+    def get_count_key(self, user, url, action='list'):
+        request = Request(APIRequestFactory().get(url))
+        request.user = user
+        paginator = CustomPagination()
+        paginator.view = SimpleNamespace(action=action)
+        return paginator.get_count_key(Recipe.objects.all(), request)
+
+    def test_shared_without_user_filters(self):
+        url = '/api/recipes/?tags=breakfast&is_favorited=0'
+        self.assertEqual(
+            self.get_count_key(self.first, url),
+            self.get_count_key(self.second, url))
+
+    def test_per_user_with_user_filters(self):
+        for url in ('/api/recipes/?is_favorited=1',
+                    '/api/recipes/?is_in_shopping_cart=true'):
+            self.assertNotEqual(
+                self.get_count_key(self.first, url),
+                self.get_count_key(self.second, url))
+        url = '/api/users/subscriptions/'
+        self.assertNotEqual(
+            self.get_count_key(self.first, url, 'subscriptions'),
+            self.get_count_key(self.second, url, 'subscriptions'))
+
+
+class StreamingBase64ImageFieldTest(TestCase):
+    """ base64 с переносами строк декодируется частями. """
+
+    def test_base64_with_newlines(self):
+        image = io.BytesIO()
+        Image.new('RGB', (40, 30), 'red').save(image, 'PNG')
+        data = 'data:image/png;base64,' + base64.encodebytes(
+            image.getvalue()).decode().replace('\n', '\r\n')
+        with mock.patch.object(fields, 'ENCODED_CHUNK_SIZE', 10):
+            file = StreamingBase64ImageField().to_internal_value(data)
+        self.addCleanup(file.close)
+        self.assertEqual(file.read(), image.getvalue())
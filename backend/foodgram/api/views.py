@@ -1,22 +1,39 @@
-from api.filters import IngredientFilter, RecipeFilter, UserFilter
-from api.pagination import CustomPagination
+from collections import defaultdict
+
+from api import exports
+from api.autocomplete import ingredient_index
+from api.cache import VersionedCacheMixin
+from api.filters import (IngredientFilter, RecipeFilter,
+                         SimilaritySearchFilter, UserFilter, is_fuzzy)
+from api.pagination import CustomPagination, IdCursorPagination
+from api.renderers import (ShoppingListCSVRenderer, ShoppingListPDFRenderer,
+                           ShoppingListTextRenderer)
 from api.serializers import (AuthorSerializer, AuthorWithRecipesSerializer,
                              IngredientSerializer, RecipeCreateSerializer,
                              RecipeSerializer, RecipeShortSerializer,
                              SubscribeSerializer, TagSerializer,
                              UserCreateSerializer)
-from api.utils import generate_pdf
 # from django.db import IntegrityError
+from django.db.models import Exists, OuterRef, Sum
+from django.http import FileResponse, StreamingHttpResponse
 from django_filters.rest_framework import DjangoFilterBackend
 from djoser.views import UserViewSet
 from recipes.models import (Favorites, Ingredient, MyShoppingCart, Recipe,
                             RecipeIngredient, Subscribtions, Tag, User)
-from rest_framework import filters, status
+from recipes.transfer import export_recipes
+from rest_framework import status
 from rest_framework.decorators import action
-from rest_framework.permissions import AllowAny, IsAuthenticated
+from rest_framework.permissions import AllowAny, IsAdminUser, IsAuthenticated
 from rest_framework.response import Response
+from rest_framework.reverse import reverse
 from rest_framework.viewsets import ModelViewSet
 
+EXPORT_STATUS_CODES = {
+    'ready': status.HTTP_200_OK,
+    'pending': status.HTTP_202_ACCEPTED,
+    'failed': status.HTTP_500_INTERNAL_SERVER_ERROR,
+}
+
 
 class CustomUserViewSet(UserViewSet):
     """
@@ -27,10 +44,18 @@ class CustomUserViewSet(UserViewSet):
     serializer_class = AuthorSerializer
     pagination_class = CustomPagination
     # filterset_class = UserFilter
-    filter_backends = (DjangoFilterBackend, filters.SearchFilter,)
+    filter_backends = (DjangoFilterBackend, SimilaritySearchFilter,)
     search_fields = ('username', 'email')
     permission_classes = (AllowAny, )
 
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        user = self.request.user
+        if user.is_anonymous:
+            return queryset
+        return queryset.annotate(is_subscribed=Exists(
+            Subscribtions.objects.filter(user=user, author=OuterRef('pk'))))
+
     def get_serializer_class(self):
         if self.action == 'create':
             return UserCreateSerializer
@@ -69,10 +94,22 @@ class CustomUserViewSet(UserViewSet):
             )
     def subscriptions(self, request):
         """ Получить на кого пользователь подписан. """
+        page = self.paginate_queryset(Subscribtions.objects.filter(
+            user=request.user).select_related(
+            'author__stats').order_by('-id'))
+        recipes = Recipe.objects.filter(
+            author__in=[subscription.author for subscription in page])
+        recipes_limit = request.GET.get('recipes_limit')
+        if recipes_limit:
+            recipes = recipes.first_per_author(int(recipes_limit))
+        else:
+            recipes = recipes.order_by('id')
+        recipes_by_author = defaultdict(list)
+        for recipe in recipes:
+            recipes_by_author[recipe.author_id].append(recipe)
         serializer = SubscribeSerializer(
-            self.paginate_queryset(Subscribtions.objects.filter(
-                                   user=request.user).order_by('-id')),
-            many=True, context={'request': request})
+            page, many=True,
+            context={'request': request, 'recipes': recipes_by_author})
         return self.get_paginated_response(serializer.data)
 
     @action(detail=False,
@@ -103,23 +140,32 @@ class AuthorViewSet(UserViewSet):
 
     def get_queryset(self):
         user = self.request.user
-        queryset = User.objects.filter(following__user=user).order_by('-id')
+        queryset = User.objects.filter(
+            following__user=user).select_related('stats').order_by('-id')
         return queryset
 
 
-class TagViewSet(ModelViewSet):
+class TagViewSet(VersionedCacheMixin, ModelViewSet):
     """ Вьюсет для тегов. """
+    cache_namespace = 'tags'
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
 
 
-class IngredientViewSet(ModelViewSet):
+class IngredientViewSet(VersionedCacheMixin, ModelViewSet):
     """ Вьюсет для ингредиентов. """
+    cache_namespace = 'ingredients'
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
     filterset_class = IngredientFilter
     filter_backends = (DjangoFilterBackend, )
 
+    def list(self, request, *args, **kwargs):
+        name = request.query_params.get('name')
+        if name and not is_fuzzy(request.query_params):
+            return Response(ingredient_index.search(name))
+        return super().list(request, *args, **kwargs)
+
 
 class RecipeViewSet(ModelViewSet):
     """ Вьюсет для рецептов. """
@@ -130,13 +176,12 @@ class RecipeViewSet(ModelViewSet):
     filter_backends = (DjangoFilterBackend, )
 
     def get_queryset(self):
-        recipes = Recipe.objects.prefetch_related(
-            'recipe_ingredients__ingredient',
-            'tags').all().order_by('-id')
+        recipes = Recipe.objects.select_related('author').with_user_flags(
+            self.request.user).order_by('-id')
         return recipes
 
     def get_serializer_class(self):
-        if self.action in ('get', 'list'):
+        if self.action in ('get', 'list', 'feed'):
             return RecipeSerializer
         return RecipeCreateSerializer
 
@@ -146,26 +191,115 @@ class RecipeViewSet(ModelViewSet):
     def perform_update(self, serializer):
         serializer.save(author=self.request.user)
 
-    @action(detail=False, methods=['get'])
+    def get_shopping_cart(self, user):
+        """ Список покупок одним сгруппированным запросом. """
+        return list(RecipeIngredient.objects.filter(
+            recipe__for_cooking__user=user
+        ).values(
+            'ingredient__name',
+            'ingredient__measurement_unit'
+        ).annotate(amount=Sum('amount')).order_by('ingredient__name'))
+
+    @action(detail=False,
+            methods=['get'],
+            permission_classes=(IsAuthenticated, ),
+            renderer_classes=(ShoppingListPDFRenderer,
+                              ShoppingListTextRenderer,
+                              ShoppingListCSVRenderer))
     def download_shopping_cart(self, request):
-        user = User.objects.prefetch_related('cooker__recipe').get(
-            id=request.user.id)
-        recipe_ids = user.cooker.all().values_list('recipe', flat=True)
-        shopping_cart = dict()
-        for ind in recipe_ids:
-            recipe = Recipe.objects.get(id=ind)
-            ingredients = recipe.ingredients.all()
-            for i in ingredients:
-                amount = RecipeIngredient.objects.get(
-                    ingredient=i, recipe=recipe).amount
-                if i.name not in shopping_cart.keys():
-                    shopping_cart.update(
-                        {i.name: [amount, i.measurement_unit]})
-                else:
-                    shopping_cart.update({i.name: [
-                        amount + shopping_cart[i.name][0],
-                        i.measurement_unit]})
-        return generate_pdf(request, shopping_cart)
+        """
+        Выгрузка списка покупок. Формат (pdf, txt, csv) —
+        по ?format= или заголовку Accept. Файл сохраняется
+        по хешу содержимого и для той же корзины отдается с диска.
+        """
+        shopping_cart = self.get_shopping_cart(request.user)
+        file_format = request.accepted_renderer.format
+        path = exports.get_path(exports.get_job_id(
+            shopping_cart, file_format, request.user.id))
+        file = exports.open_file(path)
+        if file is None:
+            exports.write_file(
+                path, request.accepted_renderer.render(shopping_cart))
+            file = open(path, 'rb')
+        return FileResponse(file, as_attachment=True,
+                            filename=f'data.{file_format}')
+
+    def get_export_response(self, request, job_id, job_status):
+        return Response({
+            'id': job_id,
+            'status': job_status,
+            'url': reverse('recipe-shopping-cart-export-result',
+                           kwargs={'job_id': job_id}, request=request),
+        }, status=EXPORT_STATUS_CODES[job_status])
+
+    @action(detail=False,
+            methods=['post'],
+            permission_classes=(IsAuthenticated, ))
+    def shopping_cart_export(self, request):
+        """ Поставить выгрузку списка покупок в очередь. """
+        file_format = request.data.get('format', 'pdf')
+        if file_format not in exports.RENDERERS:
+            return Response({'errors': 'Неизвестный формат'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        job_id = exports.enqueue(
+            self.get_shopping_cart(request.user), file_format,
+            request.user.id)
+        return self.get_export_response(
+            request, job_id, exports.get_status(job_id))
+
+    @action(detail=False,
+            methods=['get'],
+            permission_classes=(IsAuthenticated, ),
+            url_path=(r'shopping_cart_export/'
+                      r'(?P<job_id>\d+-[0-9a-f]{64}\.\w+)'))
+    def shopping_cart_export_result(self, request, job_id):
+        """ Статус выгрузки или готовый файл, только для владельца. """
+        not_found = Response({'errors': 'Выгрузка не найдена'},
+                             status=status.HTTP_404_NOT_FOUND)
+        if exports.get_owner_id(job_id) != request.user.id:
+            return not_found
+        job_status = exports.get_status(job_id)
+        if job_status is None:
+            return not_found
+        if job_status == 'ready':
+            file = exports.open_file(exports.get_path(job_id))
+            if file is None:
+                return not_found
+            file_format = job_id.rsplit('.', 1)[1]
+            return FileResponse(file, as_attachment=True,
+                                filename=f'data.{file_format}')
+        return self.get_export_response(request, job_id, job_status)
+
+    @action(detail=False,
+            methods=['get'],
+            permission_classes=(IsAuthenticated, ),
+            pagination_class=IdCursorPagination)
+    def feed(self, request):
+        """
+        Рецепты авторов, на которых подписан пользователь, от новых
+        к старым. Один запрос с подзапросом по подпискам, страницы
+        по курсору идут по индексу (author, -id).
+        """
+        queryset = self.filter_queryset(self.get_queryset().filter(
+            author__in=Subscribtions.objects.filter(
+                user=request.user).values('author')))
+        page = self.paginate_queryset(queryset)
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
+
+    @action(detail=False,
+            methods=['get'],
+            permission_classes=(IsAdminUser, ))
+    def export(self, request):
+        """
+        Все рецепты в NDJSON для переноса между базами,
+        загружаются командой import_recipes.
+        """
+        response = StreamingHttpResponse(
+            export_recipes(), content_type='application/x-ndjson')
+        response['Content-Disposition'] = (
+            'attachment; filename="recipes.ndjson"')
+        return response
 
     @action(detail=True, methods=['post', 'delete'])
     def favorite(self, request, pk):
@@ -13,9 +13,22 @@ DEBUG = os.getenv('DEBUG').lower() == 'true'
 
 ALLOWED_HOSTS = os.getenv('ALLOWED_HOSTS', default='127.0.0.1').split(',')
 
-PAGE_SIZE = os.getenv('PAGE_SIZE')
-PAGE_SIZE_QUERY_PARAM = os.getenv('PAGE_SIZE_QUERY_PARAM')
-MAX_PAGE_SIZE = os.getenv('MAX_PAGE_SIZE')
+PAGE_SIZE = int(os.getenv('PAGE_SIZE', default=6))
+PAGE_SIZE_QUERY_PARAM = os.getenv('PAGE_SIZE_QUERY_PARAM', default='limit')
+MAX_PAGE_SIZE = int(os.getenv('MAX_PAGE_SIZE', default=100))
+# списки без фильтров на PostgreSQL больше этого числа строк считаются
+# по оценке планировщика; 0 — всегда точный COUNT(*)
+COUNT_ESTIMATE_THRESHOLD = int(
+    os.getenv('COUNT_ESTIMATE_THRESHOLD', default=0))
+
+# автодополнение ингредиентов: размер выдачи и срок жизни индекса (сек)
+INGREDIENT_SEARCH_LIMIT = int(os.getenv('INGREDIENT_SEARCH_LIMIT', default=50))
+INGREDIENT_INDEX_TTL = int(os.getenv('INGREDIENT_INDEX_TTL', default=300))
+
+# за сколько дней вклад добавления в избранное или корзину
+# в популярность рецепта уменьшается вдвое
+POPULARITY_HALF_LIFE_DAYS = float(
+    os.getenv('POPULARITY_HALF_LIFE_DAYS', default=7))
 
 INSTALLED_APPS = [
     'django.contrib.admin',
@@ -24,6 +37,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'rest_framework',
     'rest_framework.authtoken',
     'corsheaders',
@@ -42,8 +56,16 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'api.middleware.SQLInstrumentationMiddleware',
 ]
 
+# доля запросов, для которых считаются SQL-запросы (0 — выключено),
+# и число одинаковых запросов, после которого это считается N+1
+SQL_INSTRUMENTATION_SAMPLE_RATE = float(
+    os.getenv('SQL_INSTRUMENTATION_SAMPLE_RATE', default=0))
+SQL_N_PLUS_ONE_THRESHOLD = int(
+    os.getenv('SQL_N_PLUS_ONE_THRESHOLD', default=5))
+
 ROOT_URLCONF = 'foodgram.urls'
 
 TEMPLATES = [
@@ -82,6 +104,24 @@ DATABASES = {
         'PORT': os.getenv('DB_PORT', default='5432')
     }
 }
+# SQLite для локального запуска и бенчмарков без PostgreSQL
+if os.getenv('DB_ENGINE') == 'sqlite3':
+    DATABASES['default'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / 'db.sqlite3',
+    }
+
+# по умолчанию кэш в памяти процесса; для нескольких воркеров
+# лучше общий бэкенд (redis, memcached, файловый)
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND',
+            default='django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv('CACHE_LOCATION', default='foodgram'),
+        'TIMEOUT': int(os.getenv('CACHE_TIMEOUT', default=300)),
+    }
+}
 
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -113,11 +153,40 @@ STATIC_ROOT = BASE_DIR / 'collected_static'
 
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
+# потоки для построения уменьшенных копий картинок рецептов
+IMAGE_WORKERS = int(os.getenv('IMAGE_WORKERS', default=2))
+# ограничения загружаемых картинок: размер (байт) и число пикселей
+IMAGE_UPLOAD_MAX_SIZE = int(
+    os.getenv('IMAGE_UPLOAD_MAX_SIZE', default=10 * 1024 * 1024))
+IMAGE_UPLOAD_MAX_PIXELS = int(
+    os.getenv('IMAGE_UPLOAD_MAX_PIXELS', default=25_000_000))
 
 FILE_DIR = BASE_DIR / 'data'
 
+# выгрузки списков покупок: каталог, число потоков и время,
+# после которого незавершенное задание ставится в очередь заново (сек)
+EXPORT_DIR = Path(os.getenv('EXPORT_DIR', default=BASE_DIR / 'exports'))
+EXPORT_WORKERS = int(os.getenv('EXPORT_WORKERS', default=2))
+EXPORT_JOB_TIMEOUT = int(os.getenv('EXPORT_JOB_TIMEOUT', default=300))
+# возраст, после которого файлы выгрузок удаляются, и как часто
+# это проверяется при записи новых файлов (сек)
+EXPORT_MAX_AGE = int(os.getenv('EXPORT_MAX_AGE', default=24 * 60 * 60))
+EXPORT_PRUNE_INTERVAL = int(
+    os.getenv('EXPORT_PRUNE_INTERVAL', default=60 * 60))
+
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'api.middleware': {'handlers': ['console'], 'level': 'INFO'},
+    },
+}
+
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
         'rest_framework.authentication.TokenAuthentication',
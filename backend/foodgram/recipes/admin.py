@@ -1,43 +1,145 @@
 from django.contrib import admin
+from django.contrib.admin.widgets import AutocompleteSelect
+from django.forms.models import BaseInlineFormSet
 from recipes.models import (Favorites, Ingredient, MyShoppingCart, Recipe,
                             RecipeIngredient, Subscribtions, Tag)
 
 
+class InputFilter(admin.SimpleListFilter):
+    """
+    Фильтр с полем ввода вместо списка всех значений,
+    для полей со слишком большим числом вариантов.
+    """
+    template = 'admin/recipes/input_filter.html'
+    field_path = None
+
+    def lookups(self, request, model_admin):
+        # без вариантов фильтр не показывается
+        return (('', ''), )
+
+    def queryset(self, request, queryset):
+        if self.value():
+            return queryset.filter(**{self.field_path: self.value()})
+        return queryset
+
+    def choices(self, changelist):
+        all_choice = next(super().choices(changelist))
+        all_choice['query_parts'] = [
+            (name, value) for name, value in changelist.params.items()
+            if name != self.parameter_name]
+        yield all_choice
+
+
+class AuthorFilter(InputFilter):
+    title = 'Автор (username)'
+    parameter_name = 'author'
+    field_path = 'author__username'
+
+
+class UserFilter(InputFilter):
+    title = 'Пользователь (username)'
+    parameter_name = 'user'
+    field_path = 'user__username'
+
+
 @admin.register(Tag)
 class TagAdmin(admin.ModelAdmin):
     list_display = ('name', 'color', 'slug')
+    search_fields = ('name', 'slug')
+
+
+class IngredientSelect(AutocompleteSelect):
+    """
+    Автодополнение ингредиента. Выбранный ингредиент берется
+    из selected, а не отдельным запросом для каждой строки.
+    """
+    selected = None
+
+    def optgroups(self, name, value, attr=None):
+        ids = [str(id) for id in value
+               if str(id) not in self.choices.field.empty_values]
+        if self.selected is None or not set(ids) <= self.selected.keys():
+            return super().optgroups(name, value, attr)
+        options = []
+        if not self.is_required:
+            options.append(self.create_option(name, '', '', False, 0))
+        for id in ids:
+            options.append(self.create_option(
+                name, id,
+                self.choices.field.label_from_instance(self.selected[id]),
+                True, len(options)))
+        return [(None, options, 0)]
+
+
+class RecipeIngredientFormSet(BaseInlineFormSet):
+    """ Ингредиенты всех строк загружаются вместе со строками. """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        selected = {
+            str(row.ingredient_id): row.ingredient
+            for row in self.get_queryset().select_related('ingredient')
+        }
+        for form in self.forms:
+            widget = form.fields['ingredient'].widget
+            getattr(widget, 'widget', widget).selected = selected
 
 
 class RecipeIngredientInline(admin.TabularInline):
     model = RecipeIngredient
+    formset = RecipeIngredientFormSet
     extra = 1
+    autocomplete_fields = ('ingredient', )
+
+    def formfield_for_foreignkey(self, db_field, request, **kwargs):
+        if db_field.name == 'ingredient':
+            kwargs['widget'] = IngredientSelect(
+                db_field, self.admin_site, using=kwargs.get('using'))
+        return super().formfield_for_foreignkey(db_field, request, **kwargs)
 
 
 @admin.register(Recipe)
 class RecipeAdmin(admin.ModelAdmin):
     inlines = (RecipeIngredientInline, )
-    list_display = ('name', 'author', 'cooking_time')
-    search_fields = ('name', 'author')
-    list_filter = ('author', 'tags')
+    list_display = ('name', 'author', 'cooking_time',
+                    'favorites_count', 'shopping_cart_count')
+    list_select_related = ('author', )
+    search_fields = ('name', 'author__username')
+    list_filter = (AuthorFilter, 'tags')
+    autocomplete_fields = ('author', 'tags')
+    show_full_result_count = False
 
 
 @admin.register(Ingredient)
 class IngredientAdmin(admin.ModelAdmin):
     list_display = ('name', 'measurement_unit')
     search_fields = ('name',)
-    list_filter = ('name',)
+    list_filter = ('measurement_unit',)
+    ordering = ('name', )
 
 
 @admin.register(Subscribtions)
 class IsSubscribedAdmin(admin.ModelAdmin):
     list_display = ('user', 'author')
+    list_select_related = ('user', 'author')
+    list_filter = (UserFilter, AuthorFilter)
+    autocomplete_fields = ('user', 'author')
+    show_full_result_count = False
 
 
 @admin.register(Favorites)
 class FavoritesAdmin(admin.ModelAdmin):
     list_display = ('user', 'recipe')
+    list_select_related = ('user', 'recipe')
+    list_filter = (UserFilter, )
+    autocomplete_fields = ('user', 'recipe')
+    show_full_result_count = False
 
 
 @admin.register(MyShoppingCart)
 class ShoppingCartAdmin(admin.ModelAdmin):
     list_display = ('user', 'recipe')
+    list_select_related = ('user', 'recipe')
+    list_filter = (UserFilter, )
+    autocomplete_fields = ('user', 'recipe')
+    show_full_result_count = False
@@ -0,0 +1,75 @@
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce, Greatest
+from recipes.models import AuthorStats, Favorites, MyShoppingCart, Recipe
+
+BATCH_SIZE = 1000
+# счетчики рецепта и модели, строки которых они считают
+RECIPE_COUNTERS = {
+    Favorites: 'favorites_count',
+    MyShoppingCart: 'shopping_cart_count',
+}
+
+
+def add(queryset, field, delta, **fields):
+    """
+    Атомарное изменение счетчика без чтения его значения,
+    fields обновляются тем же запросом.
+    """
+    return queryset.update(
+        **{field: Greatest(F(field) + delta, 0)}, **fields)
+
+
+def change_recipes_count(author_id, delta):
+    """
+    Строка счетчиков автора создается при первом новом рецепте
+    сразу с настоящим числом рецептов. Если строку одновременно
+    создал другой запрос, счетчик увеличивается обычным UPDATE.
+    Без строки уменьшать нечего: при удалении пользователя она
+    удаляется каскадом раньше его рецептов.
+    """
+    queryset = AuthorStats.objects.filter(author_id=author_id)
+    if add(queryset, 'recipes_count', delta) or delta < 0:
+        return
+    try:
+        with transaction.atomic():
+            AuthorStats.objects.create(
+                author_id=author_id,
+                recipes_count=Recipe.objects.filter(
+                    author_id=author_id).count())
+    except IntegrityError:
+        add(queryset, 'recipes_count', delta)
+
+
+def count_rows(model, field):
+    """ Число строк model, ссылающихся на текущую строку через field. """
+    return Coalesce(Subquery(
+        model.objects.filter(**{field: OuterRef('pk')}).order_by().values(
+            field).annotate(count=Count('pk')).values('count')), 0)
+
+
+def repair(queryset, field, actual):
+    """ Пересчет строк, в которых счетчик разошелся с данными. """
+    ids = list(queryset.annotate(actual=actual).exclude(
+        **{field: F('actual')}).values_list('pk', flat=True))
+    for start in range(0, len(ids), BATCH_SIZE):
+        queryset.filter(pk__in=ids[start:start + BATCH_SIZE]).update(
+            **{field: actual})
+    return len(ids)
+
+
+def reconcile_counters():
+    """ Число исправленных строк для каждого счетчика. """
+    AuthorStats.objects.bulk_create(
+        (AuthorStats(author_id=author_id)
+         for author_id in Recipe.objects.filter(
+             author__stats__isnull=True).values_list(
+             'author_id', flat=True).distinct()),
+        ignore_conflicts=True)
+    repaired = {'recipes_count': repair(
+        AuthorStats.objects.all(), 'recipes_count',
+        count_rows(Recipe, 'author'))}
+    for model, field in RECIPE_COUNTERS.items():
+        repaired[field] = repair(
+            Recipe.objects.all(), field, count_rows(model, 'recipe'))
+    return repaired
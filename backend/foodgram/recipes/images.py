@@ -0,0 +1,127 @@
+import io
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import PurePosixPath
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.dispatch import Signal
+from PIL import Image
+from recipes.models import Recipe
+
+DERIVATIVES_DIR = 'recipes/derivatives'
+# вариант: (максимальные размеры, формат; None — как у оригинала)
+VARIANTS = {
+    'card': ((480, 360), None),
+    'card_webp': ((480, 360), 'WEBP'),
+    'detail': ((1200, 900), None),
+    'detail_webp': ((1200, 900), 'WEBP'),
+}
+SAVE_OPTIONS = {
+    'JPEG': {'quality': 85, 'optimize': True, 'progressive': True},
+    'PNG': {'optimize': True},
+    'WEBP': {'quality': 80, 'method': 4},
+}
+
+logger = logging.getLogger(__name__)
+
+derivatives_created = Signal()
+
+executor = ThreadPoolExecutor(
+    max_workers=settings.IMAGE_WORKERS,
+    thread_name_prefix='recipe-images')
+
+
+def get_variant_name(name, variant):
+    path = PurePosixPath(name)
+    suffix = '.webp' if VARIANTS[variant][1] == 'WEBP' else path.suffix
+    original_format = path.suffix.lstrip('.')
+    return (f'{DERIVATIVES_DIR}/'
+            f'{path.stem}_{original_format}_{variant}{suffix}')
+
+
+def get_variant_names(name):
+    return {variant: get_variant_name(name, variant) for variant in VARIANTS}
+
+
+def get_variants(recipe, storage=default_storage):
+    """
+    Относительные url построенных производных картинки рецепта.
+    Имена берутся из recipe.image_variants, без обращений к хранилищу;
+    копии прежней картинки не подходят по имени и пропускаются.
+    """
+    name = recipe.image.name
+    if not name:
+        return {}
+    return {
+        variant: storage.url(variant_name)
+        for variant, variant_name in recipe.image_variants.items()
+        if variant in VARIANTS
+        and variant_name == get_variant_name(name, variant)
+    }
+
+
+def save_variants(name, recipe_ids):
+    """ Запоминает производные у рецептов, у которых еще эта картинка. """
+    Recipe.objects.filter(id__in=recipe_ids, image=name).update(
+        image_variants=get_variant_names(name))
+
+
+def has_derivatives(name, storage=default_storage):
+    return all(
+        storage.exists(get_variant_name(name, variant))
+        for variant in VARIANTS)
+
+
+def create_derivatives(name, storage=default_storage):
+    """
+    Уменьшенные копии картинки для карточек и страницы рецепта,
+    в формате оригинала и в WebP.
+    """
+    with storage.open(name, 'rb') as file:
+        original = Image.open(file)
+        original.load()
+    for variant, (size, image_format) in VARIANTS.items():
+        image = original.copy()
+        image.thumbnail(size, Image.LANCZOS)
+        image_format = image_format or original.format or 'PNG'
+        if image_format == 'JPEG' and image.mode not in ('RGB', 'L'):
+            image = image.convert('RGB')
+        buffer = io.BytesIO()
+        image.save(buffer, image_format, **SAVE_OPTIONS.get(image_format, {}))
+        variant_name = get_variant_name(name, variant)
+        if storage.exists(variant_name):
+            storage.delete(variant_name)
+        storage.save(variant_name, ContentFile(buffer.getvalue()))
+
+
+def process_recipe_image(name, recipe_ids):
+    try:
+        create_derivatives(name)
+    except Exception:
+        logger.exception('Не удалось обработать картинку %s', name)
+        raise
+    save_variants(name, recipe_ids)
+    derivatives_created.send(
+        sender=None, name=name, recipe_ids=recipe_ids)
+
+
+def schedule_derivatives(name, recipe_ids):
+    """ Построение производных в фоновом пуле потоков. """
+    return executor.submit(process_recipe_image, name, recipe_ids)
+
+
+def derive_images(recipes_by_image, force=False):
+    """
+    Производные для картинок {картинка: id рецептов}. Уже построенные
+    только записываются в рецепты, для остальных запускаются задачи.
+    Возвращает [(картинка, задача)].
+    """
+    jobs = []
+    for name, recipe_ids in recipes_by_image.items():
+        if force or not has_derivatives(name):
+            jobs.append((name, schedule_derivatives(name, recipe_ids)))
+        else:
+            save_variants(name, recipe_ids)
+    return jobs
@@ -0,0 +1,34 @@
+import time
+from collections import defaultdict
+
+from django.core.management import BaseCommand
+from recipes.images import derive_images
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    help = 'Create card/detail/WebP derivatives for existing recipe images'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--force', action='store_true',
+            help='Пересоздать уже построенные копии')
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        recipes_by_image = defaultdict(list)
+        images = Recipe.objects.exclude(image='').values_list(
+            'id', 'image').order_by('id')
+        for recipe_id, name in images.iterator():
+            recipes_by_image[name].append(recipe_id)
+        jobs = derive_images(recipes_by_image, force=options['force'])
+        failed = 0
+        for name, job in jobs:
+            try:
+                job.result()
+            except Exception as error:
+                failed += 1
+                self.stderr.write(f'{name}: {error}')
+        self.stdout.write(
+            f'{len(jobs) - failed} images processed, {failed} failed '
+            f'in {time.perf_counter() - start:.1f} s')
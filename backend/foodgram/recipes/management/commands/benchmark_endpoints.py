@@ -0,0 +1,204 @@
+import json
+import random
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import (CaptureQueriesContext, override_settings,
+                               setup_test_environment,
+                               teardown_test_environment)
+from recipes.counters import reconcile_counters
+from recipes.models import (Favorites, Ingredient, MyShoppingCart, Recipe,
+                            RecipeIngredient, Subscribtions, Tag, User)
+from recipes.popularity import recompute_popularity
+from rest_framework.test import APIClient
+
+BASELINE = Path(settings.BASE_DIR) / 'benchmarks' / 'endpoints.json'
+BATCH_SIZE = 2000
+TAGS = 8
+
+
+def percentile(values, share):
+    values = sorted(values)
+    return values[min(int(len(values) * share), len(values) - 1)]
+
+
+class Command(BaseCommand):
+    help = 'Benchmark the main API endpoints on a generated test database'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=200)
+        parser.add_argument('--recipes', type=int, default=1000)
+        parser.add_argument(
+            '--ingredients', type=int, default=8,
+            help='Ингредиентов в каждом рецепте')
+        parser.add_argument(
+            '--follows', type=int, default=20,
+            help='Подписок, избранного и рецептов в корзине у пользователя')
+        parser.add_argument('--repeat', type=int, default=30)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--baseline', type=Path, default=BASELINE)
+        parser.add_argument(
+            '--save', action='store_true',
+            help='Записать результаты как новый baseline')
+        parser.add_argument(
+            '--latency-tolerance', type=float, default=3.0,
+            help='Во сколько раз p95 может превысить baseline')
+        parser.add_argument(
+            '--latency-slack', type=float, default=20,
+            help='Допустимый рост p95 в мс для быстрых эндпоинтов')
+
+    def seed(self, options):
+        """ Данные создаются пачками, связи выбираются случайно. """
+        rng = random.Random(options['seed'])
+        User.objects.bulk_create(
+            (User(username=f'user{i}', email=f'user{i}@bench.ru',
+                  password='!')
+             for i in range(options['users'])),
+            batch_size=BATCH_SIZE)
+        user_ids = list(User.objects.values_list('id', flat=True))
+        Tag.objects.bulk_create(
+            Tag(name=f'Тег {i}', color=f'#{i:06x}', slug=f'tag{i}')
+            for i in range(TAGS))
+        tag_ids = list(Tag.objects.values_list('id', flat=True))
+        Ingredient.objects.bulk_create(
+            (Ingredient(name=f'ингредиент {i}', measurement_unit='г')
+             for i in range(2000)),
+            batch_size=BATCH_SIZE)
+        ingredient_ids = list(Ingredient.objects.values_list('id', flat=True))
+        Recipe.objects.bulk_create(
+            (Recipe(author_id=rng.choice(user_ids), name=f'Рецепт {i}',
+                    text='Текст рецепта', image='recipes/benchmark.png',
+                    cooking_time=rng.randint(1, 120))
+             for i in range(options['recipes'])),
+            batch_size=BATCH_SIZE)
+        recipe_ids = list(Recipe.objects.values_list('id', flat=True))
+        Recipe.tags.through.objects.bulk_create(
+            (Recipe.tags.through(recipe_id=recipe_id, tag_id=tag_id)
+             for recipe_id in recipe_ids
+             for tag_id in rng.sample(tag_ids, 2)),
+            batch_size=BATCH_SIZE)
+        RecipeIngredient.objects.bulk_create(
+            (RecipeIngredient(recipe_id=recipe_id, ingredient_id=ingredient_id,
+                              amount=rng.randint(1, 500))
+             for recipe_id in recipe_ids
+             for ingredient_id in rng.sample(
+                 ingredient_ids, options['ingredients'])),
+            batch_size=BATCH_SIZE)
+        follows = min(options['follows'], len(user_ids) - 1)
+        Subscribtions.objects.bulk_create(
+            (Subscribtions(user_id=user_id, author_id=author_id)
+             for user_id in user_ids
+             for author_id in rng.sample(
+                 [id for id in user_ids if id != user_id], follows)),
+            batch_size=BATCH_SIZE)
+        for model in (Favorites, MyShoppingCart):
+            model.objects.bulk_create(
+                (model(user_id=user_id, recipe_id=recipe_id)
+                 for user_id in user_ids
+                 for recipe_id in rng.sample(
+                     recipe_ids, min(options['follows'], len(recipe_ids)))),
+                batch_size=BATCH_SIZE)
+        reconcile_counters()
+        recompute_popularity()
+        return User.objects.get(id=user_ids[0]), recipe_ids[-1]
+
+    def get_endpoints(self, recipe_id):
+        return {
+            'recipes': '/api/recipes/',
+            'recipes_popular': '/api/recipes/?ordering=popular',
+            'recipes_filtered': '/api/recipes/?tags=tag0&tags=tag1'
+                                '&is_favorited=1',
+            'recipe_detail': f'/api/recipes/{recipe_id}/',
+            'subscriptions': '/api/users/subscriptions/?recipes_limit=3',
+            'feed': '/api/recipes/feed/?tags=tag0&tags=tag1',
+            'ingredients_search': '/api/ingredients/?name=ингредиент 1',
+            'download_shopping_cart':
+                '/api/recipes/download_shopping_cart/',
+        }
+
+    def measure(self, client, url, repeat):
+        """ Первый запрос выполняется с пустым кешем. """
+        cache.clear()
+        timings = []
+        queries = 0
+        for _ in range(repeat):
+            with CaptureQueriesContext(connection) as context:
+                start = time.perf_counter()
+                response = client.get(url)
+                if hasattr(response, 'streaming_content'):
+                    b''.join(response.streaming_content)
+                timings.append((time.perf_counter() - start) * 1000)
+            if response.status_code != 200:
+                raise CommandError(f'{url}: status {response.status_code}')
+            queries = max(queries, len(context))
+        return {
+            'p50_ms': round(statistics.median(timings), 2),
+            'p95_ms': round(percentile(timings, 0.95), 2),
+            'queries': queries,
+        }
+
+    def find_regressions(self, results, baseline, tolerance, slack):
+        errors = []
+        for name, result in results.items():
+            expected = baseline.get(name)
+            if expected is None:
+                continue
+            if result['queries'] > expected['queries']:
+                errors.append(
+                    f'{name}: {result["queries"]} queries, '
+                    f'budget {expected["queries"]}')
+            limit = max(expected['p95_ms'] * tolerance,
+                        expected['p95_ms'] + slack)
+            if result['p95_ms'] > limit:
+                errors.append(
+                    f'{name}: p95 {result["p95_ms"]} ms, '
+                    f'limit {limit:.2f} ms')
+        return errors
+
+    def handle(self, *args, **options):
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(
+            verbosity=0, autoclobber=True)
+        try:
+            with tempfile.TemporaryDirectory() as export_dir, \
+                    override_settings(EXPORT_DIR=Path(export_dir)):
+                start = time.perf_counter()
+                user, recipe_id = self.seed(options)
+                self.stdout.write(
+                    f'Seeded in {time.perf_counter() - start:.1f} s '
+                    f'({connection.vendor})')
+                client = APIClient()
+                client.force_authenticate(user)
+                results = {
+                    name: self.measure(client, url, options['repeat'])
+                    for name, url in self.get_endpoints(recipe_id).items()
+                }
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        for name, result in results.items():
+            self.stdout.write(
+                f'{name:<24} p50 {result["p50_ms"]:8.2f} ms  '
+                f'p95 {result["p95_ms"]:8.2f} ms  '
+                f'queries {result["queries"]}')
+        if options['save']:
+            options['baseline'].parent.mkdir(parents=True, exist_ok=True)
+            options['baseline'].write_text(
+                json.dumps(results, indent=4) + '\n', encoding='utf-8')
+            self.stdout.write(f'Baseline saved to {options["baseline"]}')
+            return
+        if not options['baseline'].exists():
+            return
+        errors = self.find_regressions(
+            results,
+            json.loads(options['baseline'].read_text(encoding='utf-8')),
+            options['latency_tolerance'], options['latency_slack'])
+        if errors:
+            raise CommandError('Regressions:\n' + '\n'.join(errors))
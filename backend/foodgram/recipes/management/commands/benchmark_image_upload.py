@@ -0,0 +1,80 @@
+import base64
+import io
+import os
+import struct
+import time
+import tracemalloc
+import zlib
+
+from api.fields import StreamingBase64ImageField
+from django.core.management import BaseCommand
+from drf_extra_fields.fields import Base64ImageField
+from PIL import Image
+from rest_framework.exceptions import ValidationError
+
+
+def make_png(size):
+    """ PNG из случайных пикселей, почти не сжимается. """
+    side = max(int((size / 3) ** 0.5), 1)
+    image = Image.frombytes('RGB', (side, side), os.urandom(side * side * 3))
+    buffer = io.BytesIO()
+    image.save(buffer, 'PNG', compress_level=1)
+    return buffer.getvalue()
+
+
+def make_bomb(side=40000):
+    """ Маленький PNG, заголовок которого обещает side x side пикселей. """
+    def chunk(kind, data):
+        return (struct.pack('>I', len(data)) + kind + data
+                + struct.pack('>I', zlib.crc32(kind + data)))
+
+    rows = zlib.compress(b'\x00' * (side + 1) * 16)
+    return (b'\x89PNG\r\n\x1a\n'
+            + chunk(b'IHDR', struct.pack('>II5B', side, side, 8, 0, 0, 0, 0))
+            + chunk(b'IDAT', rows) + chunk(b'IEND', b''))
+
+
+class Command(BaseCommand):
+    help = 'Measure peak memory of base64 image decoding'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sizes', type=int, nargs='+', default=[1, 10, 50],
+            help='Размеры картинок, МБ')
+
+    def measure(self, field, data):
+        tracemalloc.start()
+        start = time.perf_counter()
+        try:
+            file = field.to_internal_value(data)
+            result = f'ok {file.size} bytes'
+            file.close()
+        except ValidationError as error:
+            result = f'rejected: {error.detail[0]}'
+        except Exception as error:
+            result = f'error: {error}'
+        elapsed = time.perf_counter() - start
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        return elapsed, peak, result
+
+    def handle(self, *args, **options):
+        cases = [
+            (f'{size} MB', make_png(size * 1024 * 1024))
+            for size in options['sizes']
+        ]
+        cases.append(('bomb', make_bomb()))
+        fields = (
+            ('base64', Base64ImageField(max_length=None)),
+            ('streaming', StreamingBase64ImageField()),
+        )
+        self.stdout.write(
+            'Пиковая память Python (tracemalloc) без учета входной строки')
+        for title, content in cases:
+            data = 'data:image/png;base64,' + base64.b64encode(
+                content).decode()
+            for name, field in fields:
+                elapsed, peak, result = self.measure(field, data)
+                self.stdout.write(
+                    f'{title:<8} {name:<10} {elapsed * 1000:9.1f} ms '
+                    f'peak {peak / 1024 / 1024:8.1f} MB  {result}')
@@ -0,0 +1,70 @@
+import statistics
+import time
+
+from api.filters import similarity_search
+from django.core.management import BaseCommand
+from django.db import connection, transaction
+from django.db.models import Q
+from recipes.models import User
+
+BATCH_SIZE = 5000
+
+
+class Command(BaseCommand):
+    help = 'Benchmark user search on a generated set of users'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=100000)
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument('--query', default='bench4242')
+        parser.add_argument('--typo', default='bnech4242')
+        parser.add_argument(
+            '--keep', action='store_true',
+            help='Не откатывать созданных пользователей')
+
+    def measure(self, title, queryset, repeat):
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            queryset.count()
+            found = list(queryset[:6])
+            timings.append((time.perf_counter() - start) * 1000)
+        self.stdout.write(
+            f'{title:<32} median {statistics.median(timings):8.2f} ms  '
+            f'max {max(timings):8.2f} ms  first page {len(found)}')
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            start = time.perf_counter()
+            for offset in range(0, options['users'], BATCH_SIZE):
+                User.objects.bulk_create(
+                    User(username=f'bench{i}',
+                         email=f'bench{i}@bench.ru',
+                         password='!')
+                    for i in range(
+                        offset, min(offset + BATCH_SIZE, options['users'])))
+            self.stdout.write(
+                f'{options["users"]} users created in '
+                f'{time.perf_counter() - start:.1f} s '
+                f'({connection.vendor})')
+            if connection.vendor == 'postgresql':
+                with connection.cursor() as cursor:
+                    cursor.execute('ANALYZE auth_user')
+
+            query, typo = options['query'], options['typo']
+            users = User.objects.order_by('-id')
+            self.measure(
+                'icontains', users.filter(
+                    Q(username__icontains=query)
+                    | Q(email__icontains=query)),
+                options['repeat'])
+            self.measure(
+                'fuzzy', similarity_search(
+                    users, ('username', 'email'), query),
+                options['repeat'])
+            self.measure(
+                'fuzzy with typo', similarity_search(
+                    users, ('username', 'email'), typo),
+                options['repeat'])
+            if not options['keep']:
+                transaction.set_rollback(True)
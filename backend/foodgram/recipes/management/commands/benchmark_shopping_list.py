@@ -0,0 +1,46 @@
+import time
+import tracemalloc
+
+from api.renderers import (ShoppingListCSVRenderer, ShoppingListPDFRenderer,
+                           ShoppingListTextRenderer, register_fonts)
+from django.core.management import BaseCommand
+
+RENDERERS = (
+    ShoppingListPDFRenderer,
+    ShoppingListTextRenderer,
+    ShoppingListCSVRenderer,
+)
+
+
+class Command(BaseCommand):
+    help = 'Benchmark shopping list rendering time and peak memory'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--lines', type=int, nargs='+', default=[10, 500, 5000])
+        parser.add_argument('--repeat', type=int, default=3)
+
+    def handle(self, *args, **options):
+        register_fonts()
+        for count in options['lines']:
+            rows = [{
+                'ingredient__name': f'ингредиент номер {i}',
+                'ingredient__measurement_unit': 'г',
+                'amount': i,
+            } for i in range(count)]
+            for renderer_class in RENDERERS:
+                renderer = renderer_class()
+                timings = []
+                for _ in range(options['repeat']):
+                    start = time.perf_counter()
+                    content = renderer.render(rows)
+                    timings.append(time.perf_counter() - start)
+                tracemalloc.start()
+                renderer.render(rows)
+                _, peak = tracemalloc.get_traced_memory()
+                tracemalloc.stop()
+                self.stdout.write(
+                    f'{count:>6} lines {renderer.format:>4}: '
+                    f'{min(timings) * 1000:9.1f} ms  '
+                    f'peak {peak / 1024:9.1f} KiB  '
+                    f'size {len(content) / 1024:8.1f} KiB')
@@ -0,0 +1,47 @@
+import json
+import sys
+import time
+
+from api.cache import bump_count_version
+from django.core.management import BaseCommand, CommandError
+from recipes.counters import reconcile_counters
+from recipes.models import Recipe
+from recipes.transfer import CHUNK_SIZE, batches, import_batch
+
+
+class Command(BaseCommand):
+    help = 'Import recipes from an NDJSON export'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Файл выгрузки, - для stdin')
+        parser.add_argument('--batch-size', type=int, default=CHUNK_SIZE)
+
+    def read_records(self, file):
+        for number, line in enumerate(file, 1):
+            if not line.strip():
+                continue
+            try:
+                yield json.loads(line)
+            except ValueError as error:
+                raise CommandError(f'line {number}: {error}')
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        file = (sys.stdin if options['path'] == '-'
+                else open(options['path'], encoding='utf-8'))
+        rows = created = 0
+        with file:
+            for records in batches(
+                    self.read_records(file), options['batch_size']):
+                batch_created, errors = import_batch(records)
+                rows += len(records)
+                created += batch_created
+                for error in errors:
+                    self.stderr.write(error)
+        # bulk_create не отправляет сигналы
+        bump_count_version(Recipe)
+        reconcile_counters()
+        elapsed = time.perf_counter() - start
+        self.stdout.write(
+            f'{created} recipes created, {rows - created} skipped, '
+            f'{rows / elapsed if elapsed else 0:.0f} rows/s')
@@ -1,79 +1,191 @@
-﻿import json
+﻿import csv
+import json
 import os
+import time
 import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from urllib.parse import urlparse
 
+from api.cache import bump_count_version, bump_version
 from django.conf import settings
 from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
 from django.core.management import BaseCommand
+from django.db import transaction
+from recipes.counters import reconcile_counters
+from recipes.images import schedule_derivatives
 from recipes.models import Ingredient, Recipe, RecipeIngredient, Tag, User
+from recipes.transfer import batches
 
-TABLES_DICT = {
-    Ingredient: 'ingredients.json',
-    Tag: 'tags.json',
-    Recipe: 'recipes.json'
-}
 USERS_COUNT = 3
+BATCH_SIZE = 1000
+IMAGE_TIMEOUT = 30
+
+
+def read_image(location):
+    """ Картинка по http(s)/file:// url или по пути относительно data. """
+    if urlparse(location).scheme in ('http', 'https', 'file'):
+        with urllib.request.urlopen(location, timeout=IMAGE_TIMEOUT) as file:
+            return file.read()
+    return (Path(settings.FILE_DIR) / location).read_bytes()
 
 
 class Command(BaseCommand):
     help = 'Load data from file'
 
-    def handle(self, *args, **kwargs):
-        users = []
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+        parser.add_argument(
+            '--workers', type=int, default=4,
+            help='Число потоков для загрузки картинок')
+
+    def report(self, title, created, rows, start):
+        elapsed = time.perf_counter() - start
+        self.stdout.write(
+            f'{title}: {created} created, {rows - created} skipped, '
+            f'{rows / elapsed if elapsed else 0:.0f} rows/s')
 
-        for i in range(USERS_COUNT):
-            email = f'email{i}@test.ru'
-            if User.objects.filter(email=email).exists():
-                users.append(User.objects.get(email=email))
-            else:
-                new_user = User.objects.create_user(
-                    email=f'email{i}@test.ru',
+    def load_users(self):
+        emails = [f'email{i}@test.ru' for i in range(USERS_COUNT)]
+        users = {user.email: user
+                 for user in User.objects.filter(email__in=emails)}
+        for i, email in enumerate(emails):
+            if email not in users:
+                users[email] = User.objects.create_user(
+                    email=email,
                     username=f'test{i}',
                     first_name=f'test{i}',
                     last_name=f'testtest{i}',
                     password=f'testpassword{i}')
-                users.append(new_user)
-
-        for model, file in TABLES_DICT.items():
-            with open(f'{settings.FILE_DIR}/{file}',
-                      'r',
-                      encoding='utf-8-sig') as f:
-                datas = json.loads(f.read())
-                recipe_num = 0
-                if model == Recipe:
-                    for data in datas:
-                        image_url = data.pop('image')
-                        response = urllib.request.urlopen(image_url)
-                        image_content = response.read()
-                        image_name = os.path.basename(image_url)
-                        image_file = ContentFile(image_content,
-                                                 name=image_name)
-
-                        ingredients_data = data.pop('ingredients')
-                        for ing in ingredients_data:
-                            ing.update({"id": Ingredient.objects.get(
-                                name=ing['name']).id})
-                            ing.pop('name')
-
-                        tags_data = data.pop('tags')
-
-                        recipe = Recipe.objects.create(
-                            **data, author=users[recipe_num % USERS_COUNT])
-                        recipe.tags.set(tags_data)
-                        recipe.image.save(image_name, image_file)
-
-                        ingredient_list = []
-                        for ingredient_data in ingredients_data:
-                            ingredient_list.append(
-                                RecipeIngredient(
-                                    ingredient=Ingredient.objects.get(
-                                        id=ingredient_data.pop('id')),
-                                    amount=ingredient_data.pop('amount'),
-                                    recipe=recipe))
-                        RecipeIngredient.objects.bulk_create(ingredient_list)
-                        recipe_num += 1
-                else:
-                    for data in datas:
-                        model.objects.get_or_create(**data)
-                print(f'{file} successfully imported.')
-        print('Import from json file is complete.')
+        return [users[email] for email in emails]
+
+    def load_ingredients(self, batch_size):
+        """ Ингредиенты читаются из csv построчно и создаются пачками. """
+        start = time.perf_counter()
+        existing = set(
+            Ingredient.objects.values_list('name', 'measurement_unit'))
+        rows = created = 0
+        with open(Path(settings.FILE_DIR) / 'ingredients.csv',
+                  encoding='utf-8-sig', newline='') as file:
+            for batch in batches(csv.reader(file), batch_size):
+                rows += len(batch)
+                new = []
+                for name, measurement_unit in batch:
+                    if (name, measurement_unit) not in existing:
+                        existing.add((name, measurement_unit))
+                        new.append(Ingredient(
+                            name=name, measurement_unit=measurement_unit))
+                Ingredient.objects.bulk_create(new, ignore_conflicts=True)
+                created += len(new)
+        self.report('ingredients.csv', created, rows, start)
+
+    def load_tags(self):
+        start = time.perf_counter()
+        with open(Path(settings.FILE_DIR) / 'tags.json',
+                  encoding='utf-8-sig') as file:
+            tags = json.load(file)
+        existing = set(Tag.objects.values_list('slug', flat=True))
+        new = [Tag(**tag) for tag in tags if tag['slug'] not in existing]
+        Tag.objects.bulk_create(new, ignore_conflicts=True)
+        self.report('tags.json', len(new), len(tags), start)
+
+    def load_recipes(self, users, workers, batch_size):
+        """
+        Уже загруженные рецепты (автор и название совпадают) пропускаются,
+        картинки остальных скачиваются параллельно.
+        """
+        start = time.perf_counter()
+        with open(Path(settings.FILE_DIR) / 'recipes.json',
+                  encoding='utf-8-sig') as file:
+            recipes = json.load(file)
+        for number, recipe in enumerate(recipes):
+            recipe['author'] = users[number % USERS_COUNT]
+        existing = set(Recipe.objects.filter(
+            author__in=users).values_list('author_id', 'name'))
+        ingredient_ids = dict(Ingredient.objects.order_by(
+            '-id').values_list('name', 'id'))
+        new = []
+        for recipe in recipes:
+            if (recipe['author'].id, recipe['name']) in existing:
+                continue
+            unknown = [ingredient['name']
+                       for ingredient in recipe['ingredients']
+                       if ingredient['name'] not in ingredient_ids]
+            if unknown:
+                self.stderr.write(
+                    f'{recipe["name"]}: unknown ingredients {unknown}')
+                continue
+            new.append(recipe)
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            images = executor.map(
+                lambda recipe: self.save_image(recipe['image']), new)
+            images = list(images)
+        new = [
+            {**recipe, 'image': image}
+            for recipe, image in zip(new, images) if image is not None]
+
+        tag_ids = set(Tag.objects.values_list('id', flat=True))
+        with transaction.atomic():
+            Recipe.objects.bulk_create(
+                (Recipe(author=recipe['author'], name=recipe['name'],
+                        text=recipe['text'], image=recipe['image'],
+                        cooking_time=recipe['cooking_time'])
+                 for recipe in new),
+                batch_size=batch_size)
+            recipe_ids = {
+                (author_id, name): id
+                for id, author_id, name in Recipe.objects.filter(
+                    author__in=users,
+                    name__in=[recipe['name'] for recipe in new],
+                ).values_list('id', 'author_id', 'name')}
+            recipe_tags = []
+            recipe_ingredients = []
+            for recipe in new:
+                recipe_id = recipe_ids[recipe['author'].id, recipe['name']]
+                recipe_tags.extend(
+                    Recipe.tags.through(recipe_id=recipe_id, tag_id=tag_id)
+                    for tag_id in recipe['tags'] if tag_id in tag_ids)
+                recipe_ingredients.extend(
+                    RecipeIngredient(
+                        recipe_id=recipe_id,
+                        ingredient_id=ingredient_ids[ingredient['name']],
+                        amount=ingredient['amount'])
+                    for ingredient in recipe['ingredients'])
+            Recipe.tags.through.objects.bulk_create(
+                recipe_tags, batch_size=batch_size, ignore_conflicts=True)
+            RecipeIngredient.objects.bulk_create(
+                recipe_ingredients, batch_size=batch_size)
+        self.report('recipes.json', len(new), len(recipes), start)
+
+        jobs = [schedule_derivatives(recipe['image'], (
+            recipe_ids[recipe['author'].id, recipe['name']], ))
+            for recipe in new]
+        for recipe, job in zip(new, jobs):
+            if job.exception() is not None:
+                self.stderr.write(f'{recipe["image"]}: {job.exception()}')
+
+    def save_image(self, location):
+        try:
+            content = read_image(location)
+        except (OSError, ValueError) as error:
+            self.stderr.write(f'{location}: {error}')
+            return None
+        name = Recipe.image.field.generate_filename(
+            None, os.path.basename(urlparse(location).path))
+        return default_storage.save(name, ContentFile(content))
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        users = self.load_users()
+        self.load_ingredients(options['batch_size'])
+        self.load_tags()
+        self.load_recipes(users, options['workers'], options['batch_size'])
+        # bulk_create не отправляет сигналы, кеши сбрасываются явно
+        bump_version('ingredients')
+        bump_version('tags')
+        bump_count_version(Recipe)
+        reconcile_counters()
+        self.stdout.write(
+            f'Import is complete in {time.perf_counter() - start:.1f} s.')
@@ -0,0 +1,16 @@
+from api import exports
+from django.conf import settings
+from django.core.management import BaseCommand
+
+
+class Command(BaseCommand):
+    help = 'Delete shopping list exports older than EXPORT_MAX_AGE'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--max-age', type=int, default=settings.EXPORT_MAX_AGE,
+            help='Возраст файла в секундах')
+
+    def handle(self, *args, **options):
+        removed = exports.prune(options['max_age'])
+        self.stdout.write(f'{removed} export files removed.')
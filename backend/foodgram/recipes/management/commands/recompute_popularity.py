@@ -0,0 +1,18 @@
+import time
+
+from django.core.management import BaseCommand
+from recipes.popularity import BATCH_SIZE, recompute_popularity
+
+
+class Command(BaseCommand):
+    help = 'Recompute recipe popularity from favorites and shopping carts'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        repaired = recompute_popularity(options['batch_size'])
+        self.stdout.write(
+            f'popularity: {repaired} rows repaired '
+            f'in {time.perf_counter() - start:.1f} s.')
@@ -0,0 +1,14 @@
+import time
+
+from django.core.management import BaseCommand
+from recipes.counters import reconcile_counters
+
+
+class Command(BaseCommand):
+    help = 'Repair drift of recipe, favorites and shopping cart counters'
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        for field, repaired in reconcile_counters().items():
+            self.stdout.write(f'{field}: {repaired} rows repaired')
+        self.stdout.write(f'Done in {time.perf_counter() - start:.1f} s.')
@@ -0,0 +1,207 @@
+import csv
+import io
+import itertools
+import random
+import time
+from datetime import timedelta
+
+from api.cache import bump_count_version
+from django.core.management import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+from recipes.counters import reconcile_counters
+from recipes.models import (Favorites, Ingredient, MyShoppingCart, Recipe,
+                            RecipeIngredient, Subscribtions, Tag, User)
+from recipes.popularity import recompute_popularity
+from recipes.transfer import batches
+
+BATCH_SIZE = 10000
+# избранное и корзины заполнялись за этот период
+HISTORY = timedelta(days=90)
+
+
+class ZipfSampler:
+    """
+    Выбор элементов с вероятностью 1 / rank ** exponent:
+    немногие популярные элементы встречаются чаще всего.
+    """
+    def __init__(self, rng, population, exponent):
+        self.rng = rng
+        self.population = list(population)
+        rng.shuffle(self.population)
+        self.cum_weights = list(itertools.accumulate(
+            1 / rank ** exponent
+            for rank in range(1, len(self.population) + 1)))
+
+    def choice(self):
+        return self.rng.choices(
+            self.population, cum_weights=self.cum_weights)[0]
+
+    def sample(self, count, exclude=None):
+        """
+        count разных элементов, exclude не выбирается. Не больше
+        половины множества, иначе редкие элементы ищутся слишком долго.
+        """
+        count = min(count, len(self.population) // 2)
+        chosen = set()
+        while len(chosen) < count:
+            chosen.update(
+                item for item in self.rng.choices(
+                    self.population, cum_weights=self.cum_weights,
+                    k=2 * (count - len(chosen)))
+                if item != exclude)
+        return list(chosen)[:count]
+
+
+class Command(BaseCommand):
+    help = 'Generate production-sized synthetic data'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1_000_000)
+        parser.add_argument('--recipes', type=int, default=2_000_000)
+        parser.add_argument(
+            '--ingredients', type=int, default=8,
+            help='Среднее число ингредиентов в рецепте')
+        parser.add_argument(
+            '--follows', type=int, default=10,
+            help='Среднее число подписок пользователя')
+        parser.add_argument(
+            '--favorites', type=int, default=10,
+            help='Среднее число рецептов в избранном')
+        parser.add_argument(
+            '--cart', type=int, default=3,
+            help='Среднее число рецептов в корзине')
+        parser.add_argument('--zipf', type=float, default=1.1)
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+        parser.add_argument('--image', default='images/no-photo.jpg')
+        parser.add_argument(
+            '--no-copy', action='store_true',
+            help='bulk_create вместо COPY на PostgreSQL')
+
+    def insert(self, model, fields, rows, total):
+        """ Строки пачками: COPY на PostgreSQL, иначе bulk_create. """
+        use_copy = connection.vendor == 'postgresql' and not self.no_copy
+        columns = [model._meta.get_field(field).column for field in fields]
+        start = time.perf_counter()
+        done = 0
+        for batch in batches(rows, self.batch_size):
+            with transaction.atomic():
+                if use_copy:
+                    buffer = io.StringIO()
+                    csv.writer(buffer).writerows(batch)
+                    buffer.seek(0)
+                    with connection.cursor() as cursor:
+                        cursor.copy_expert(
+                            f'COPY {model._meta.db_table} '
+                            f'({", ".join(columns)}) '
+                            f'FROM STDIN WITH (FORMAT csv)', buffer)
+                else:
+                    model.objects.bulk_create(
+                        model(**dict(zip(fields, row))) for row in batch)
+            done += len(batch)
+            elapsed = time.perf_counter() - start
+            self.stdout.write(
+                f'{model._meta.db_table}: {done}/~{total} rows, '
+                f'{done / elapsed:.0f} rows/s', ending='\r')
+            self.stdout.flush()
+        self.stdout.write('')
+        return done
+
+    def new_ids(self, model, last_id):
+        return list(model.objects.filter(id__gt=last_id).order_by(
+            'id').values_list('id', flat=True))
+
+    def power_law(self, mean):
+        """ У большинства мало записей, у немногих — очень много. """
+        # среднее распределения Парето с alpha = 2 равно 2
+        return int(self.rng.paretovariate(2) * mean / 2)
+
+    def random_time(self):
+        return (self.now - self.rng.random() * HISTORY).isoformat()
+
+    def handle(self, *args, **options):
+        self.now = timezone.now()
+        self.rng = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        self.no_copy = options['no_copy']
+        prefix = f'scale{options["seed"]}_'
+        if User.objects.filter(username__startswith=prefix).exists():
+            raise CommandError(
+                f'Data with seed {options["seed"]} already exists.')
+        ingredient_ids = list(Ingredient.objects.values_list('id', flat=True))
+        tag_ids = list(Tag.objects.values_list('id', flat=True))
+        if not ingredient_ids or not tag_ids:
+            raise CommandError('Load ingredients and tags first (loaddata).')
+        start = time.perf_counter()
+        rows = 0
+
+        last_id = User.objects.order_by('-id').values_list(
+            'id', flat=True).first() or 0
+        rows += self.insert(
+            User,
+            ('username', 'email', 'password', 'first_name', 'last_name',
+             'is_staff', 'is_active', 'is_superuser', 'date_joined'),
+            ((f'{prefix}{i}', f'{prefix}{i}@example.com', '!',
+              f'Имя{i}', f'Фамилия{i}', False, True, False,
+              '2023-01-01T00:00:00Z')
+             for i in range(options['users'])),
+            options['users'])
+        user_ids = self.new_ids(User, last_id)
+        authors = ZipfSampler(self.rng, user_ids, options['zipf'])
+
+        last_id = Recipe.objects.order_by('-id').values_list(
+            'id', flat=True).first() or 0
+        rows += self.insert(
+            Recipe,
+            ('author_id', 'name', 'text', 'image', 'image_variants',
+             'cooking_time', 'favorites_count', 'shopping_cart_count',
+             'popularity'),
+            ((authors.choice(), f'Рецепт {i}', 'Текст рецепта',
+              options['image'], {}, self.rng.randint(5, 180), 0, 0, 0)
+             for i in range(options['recipes'])),
+            options['recipes'])
+        recipe_ids = self.new_ids(Recipe, last_id)
+        recipes = ZipfSampler(self.rng, recipe_ids, options['zipf'])
+        ingredients = ZipfSampler(self.rng, ingredient_ids, options['zipf'])
+
+        rows += self.insert(
+            Recipe.tags.through, ('recipe_id', 'tag_id'),
+            ((recipe_id, tag_id) for recipe_id in recipe_ids
+             for tag_id in self.rng.sample(
+                 tag_ids, self.rng.randint(1, min(3, len(tag_ids))))),
+            len(recipe_ids) * 2)
+        rows += self.insert(
+            RecipeIngredient, ('recipe_id', 'ingredient_id', 'amount'),
+            ((recipe_id, ingredient_id, self.rng.randint(1, 500))
+             for recipe_id in recipe_ids
+             for ingredient_id in ingredients.sample(max(1, int(
+                 self.rng.gauss(options['ingredients'], 3))))),
+            len(recipe_ids) * options['ingredients'])
+        rows += self.insert(
+            Subscribtions, ('user_id', 'author_id'),
+            ((user_id, author_id) for user_id in user_ids
+             for author_id in authors.sample(
+                 self.power_law(options['follows']), exclude=user_id)),
+            len(user_ids) * options['follows'])
+        for model, mean in ((Favorites, options['favorites']),
+                            (MyShoppingCart, options['cart'])):
+            rows += self.insert(
+                model, ('user_id', 'recipe_id', 'created'),
+                ((user_id, recipe_id, self.random_time())
+                 for user_id in user_ids
+                 for recipe_id in recipes.sample(self.power_law(mean))),
+                len(user_ids) * mean)
+
+        self.stdout.write('Reconciling counters...')
+        reconcile_counters()
+        self.stdout.write('Computing popularity...')
+        recompute_popularity()
+        for model in (Recipe, Subscribtions, User):
+            bump_count_version(model)
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE')
+        elapsed = time.perf_counter() - start
+        self.stdout.write(
+            f'{rows} rows in {elapsed:.1f} s ({rows / elapsed:.0f} rows/s)')
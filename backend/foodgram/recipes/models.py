@@ -1,6 +1,10 @@
 from django.contrib.auth import get_user_model
+from django.core.exceptions import EmptyResultSet
 from django.db import models
-from django.db.models import CheckConstraint, F, Q, UniqueConstraint
+from django.db.models import (BooleanField, CheckConstraint, Exists, F,
+                              OuterRef, Q, UniqueConstraint, Value, Window)
+from django.db.models.functions import RowNumber
+from django.utils import timezone
 
 User = get_user_model()
 
@@ -38,11 +42,58 @@ class Ingredient(models.Model):
     class Meta:
         verbose_name = 'Ингредиент'
         verbose_name_plural = 'Ингредиенты'
+        constraints = [
+            UniqueConstraint(
+                fields=['name', 'measurement_unit'],
+                name='unique_ingredient'),
+        ]
 
     def __str__(self):
         return f'{self.name}, {self.measurement_unit}.'
 
 
+class RecipeQuerySet(models.QuerySet):
+    """ Набор рецептов с дополнительными аннотациями. """
+
+    def with_user_flags(self, user):
+        """
+        Пометки is_favorited, is_in_shopping_cart и подписки на автора
+        для пользователя подзапросами, без запроса на каждый рецепт.
+        """
+        if user.is_anonymous:
+            false = Value(False, output_field=BooleanField())
+            return self.annotate(
+                is_favorited=false,
+                is_in_shopping_cart=false,
+                author_is_subscribed=false)
+        return self.annotate(
+            is_favorited=Exists(Favorites.objects.filter(
+                user=user, recipe=OuterRef('pk'))),
+            is_in_shopping_cart=Exists(MyShoppingCart.objects.filter(
+                user=user, recipe=OuterRef('pk'))),
+            author_is_subscribed=Exists(Subscribtions.objects.filter(
+                user=user, author=OuterRef('author'))))
+
+    def first_per_author(self, limit):
+        """
+        Не больше limit первых рецептов каждого автора
+        одним запросом с оконной функцией ROW_NUMBER().
+        """
+        queryset = self.annotate(recipe_number=Window(
+            expression=RowNumber(),
+            partition_by=F('author_id'),
+            order_by=F('id').asc()))
+        try:
+            sql, params = queryset.query.sql_with_params()
+        except EmptyResultSet:
+            # например, author__in=[] для пустой страницы подписок
+            return self.none()
+        return self.model.objects.raw(
+            f'SELECT * FROM ({sql}) AS recipes WHERE recipe_number <= %s '
+            f'ORDER BY author_id, id',
+            (*params, limit))
+
+
 class Recipe(models.Model):
     """ Модель рецептов. """
     tags = models.ManyToManyField(
@@ -69,6 +120,10 @@ class Recipe(models.Model):
         upload_to='recipes/',
         blank=False,
         null=False)
+    image_variants = models.JSONField(
+        default=dict,
+        editable=False,
+        verbose_name='Уменьшенные копии картинки')
     text = models.TextField(
         blank=False,
         null=False,
@@ -77,15 +132,54 @@ class Recipe(models.Model):
         blank=False,
         null=False,
         verbose_name='Время приготовления (мин)')
+    favorites_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='В избранном')
+    shopping_cart_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='В корзинах')
+    popularity = models.FloatField(
+        default=0,
+        editable=False,
+        verbose_name='Популярность')
+
+    objects = RecipeQuerySet.as_manager()
 
     class Meta:
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
+        indexes = [
+            # лента подписок: рецепты авторов в порядке -id
+            models.Index(
+                fields=['author', '-id'], name='recipe_author_id_idx'),
+            # ?ordering=popular
+            models.Index(
+                fields=['-popularity', '-id'], name='recipe_popularity_idx'),
+        ]
 
     def __str__(self):
         return self.name
 
 
+class AuthorStats(models.Model):
+    """ Счетчики автора, поддерживаются сигналами. """
+    author = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='stats',
+        verbose_name='Автор')
+    recipes_count = models.PositiveIntegerField(
+        default=0,
+        verbose_name='Рецептов')
+
+    class Meta:
+        verbose_name = 'Счетчики автора'
+        verbose_name_plural = 'Счетчики авторов'
+
+
 class RecipeIngredient(models.Model):
     """ Связь ингредиентов и рецептов. """
     recipe = models.ForeignKey(
@@ -142,6 +236,10 @@ class Favorites(models.Model):
         related_name='favorite_recipe',
         verbose_name='Рецепт'
     )
+    created = models.DateTimeField(
+        default=timezone.now,
+        verbose_name='Добавлен'
+    )
 
     class Meta:
         verbose_name = 'Избранное'
@@ -168,6 +266,10 @@ class MyShoppingCart(models.Model):
         related_name='for_cooking',
         verbose_name='Рецепт'
     )
+    created = models.DateTimeField(
+        default=timezone.now,
+        verbose_name='Добавлен'
+    )
 
     class Meta:
         verbose_name = 'Корзина'
@@ -0,0 +1,87 @@
+import math
+from collections import defaultdict
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.db.models import Case, F, Q, Value, When
+from django.db.models.functions import Abs, Greatest, Ln, Power
+from recipes.models import Favorites, MyShoppingCart, Recipe
+
+BATCH_SIZE = 1000
+EPOCH = datetime(2023, 1, 1, tzinfo=timezone.utc)
+WEIGHTS = {
+    Favorites: 1.0,
+    MyShoppingCart: 0.5,
+}
+LN2 = math.log(2)
+# нижняя граница доли, остающейся после удаления события
+MIN_REMAINDER = 1e-15
+
+
+def event_score(model, created):
+    """
+    log2 веса события. Вес убывает вдвое за POPULARITY_HALF_LIFE_DAYS,
+    но вместо старения всех рецептов новые события весят больше:
+    2 ** ((created - EPOCH) / период). Порядок рецептов тот же,
+    а строка рецепта меняется только при записи события.
+    В popularity хранится log2(1 + сумма весов), без переполнения.
+    """
+    half_life = settings.POPULARITY_HALF_LIFE_DAYS * 24 * 60 * 60
+    return (math.log2(WEIGHTS[model])
+            + (created - EPOCH).total_seconds() / half_life)
+
+
+def added(model, created):
+    """ Выражение для popularity после добавления события. """
+    score = event_score(model, created)
+    return Greatest(F('popularity'), score) + Ln(
+        1 + Power(2.0, -Abs(F('popularity') - score))) / LN2
+
+
+def removed(model, created):
+    """
+    Выражение для popularity после удаления события. Вычитание
+    в логарифмах неточно, точное значение восстановит пересчет,
+    но после удаления последнего события популярность сразу 0.
+    """
+    score = event_score(model, created)
+    last_event = (Q(favorites_count__lte=1, shopping_cart_count=0)
+                  | Q(favorites_count=0, shopping_cart_count__lte=1))
+    return Case(
+        When(last_event, then=Value(0.0)),
+        default=Greatest(F('popularity') + Ln(Greatest(
+            1 - Power(2.0, score - F('popularity')), MIN_REMAINDER)) / LN2,
+            0.0))
+
+
+def combine(scores):
+    """ log2(1 + сумма 2 ** score) без переполнения. """
+    top = max((0, *scores))
+    return top + math.log2(
+        2 ** -top + sum(2 ** (score - top) for score in scores))
+
+
+def recompute_popularity(batch_size=BATCH_SIZE):
+    """ Пересчет по всем событиям пачками рецептов, число исправленных. """
+    repaired = 0
+    last_id = 0
+    while True:
+        current = dict(Recipe.objects.filter(id__gt=last_id).order_by(
+            'id').values_list('id', 'popularity')[:batch_size])
+        if not current:
+            return repaired
+        first_id, last_id = min(current), max(current)
+        scores = defaultdict(list)
+        for model in WEIGHTS:
+            for recipe_id, created in model.objects.filter(
+                    recipe_id__gte=first_id,
+                    recipe_id__lte=last_id).values_list(
+                    'recipe_id', 'created').iterator():
+                scores[recipe_id].append(event_score(model, created))
+        changed = []
+        for recipe_id, popularity in current.items():
+            actual = combine(scores.get(recipe_id, ()))
+            if not math.isclose(actual, popularity, abs_tol=1e-9):
+                changed.append(Recipe(id=recipe_id, popularity=actual))
+        Recipe.objects.bulk_update(changed, ['popularity'])
+        repaired += len(changed)
@@ -0,0 +1,76 @@
+from django.db import connections, transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from recipes.counters import RECIPE_COUNTERS, add, change_recipes_count
+from recipes.images import (get_variant_names, has_derivatives, save_variants,
+                            schedule_derivatives)
+from recipes.models import Favorites, MyShoppingCart, Recipe
+from recipes.popularity import added, removed
+
+SEARCH_INDEXES = (
+    ('recipes_ingredient_name_trgm', 'recipes_ingredient', 'name'),
+    ('auth_user_username_trgm', 'auth_user', 'username'),
+    ('auth_user_email_trgm', 'auth_user', 'email'),
+)
+
+
+def create_search_indexes(using, **kwargs):
+    """
+    Триграммные индексы для поиска по вхождению и похожести.
+    Таблица auth_user не принадлежит проекту, поэтому индексы
+    создаются после миграций и только на PostgreSQL.
+    """
+    connection = connections[using]
+    if connection.vendor != 'postgresql':
+        return
+    with connection.cursor() as cursor:
+        cursor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+        for name, table, column in SEARCH_INDEXES:
+            cursor.execute(
+                f'CREATE INDEX IF NOT EXISTS {name} ON {table} '
+                f'USING gin (UPPER({column}) gin_trgm_ops)')
+
+
+@receiver(post_save, sender=Recipe)
+def create_image_derivatives(instance, **kwargs):
+    """
+    Производные строятся один раз для каждой новой картинки,
+    уже построенные только записываются в рецепт.
+    """
+    name = instance.image.name
+    if not name or instance.image_variants == get_variant_names(name):
+        return
+    if has_derivatives(name):
+        save_variants(name, (instance.id, ))
+    else:
+        transaction.on_commit(
+            lambda: schedule_derivatives(name, (instance.id, )))
+
+
+@receiver(post_save, sender=Recipe)
+def count_created_recipe(instance, created, **kwargs):
+    if created:
+        change_recipes_count(instance.author_id, 1)
+
+
+@receiver(post_delete, sender=Recipe)
+def count_deleted_recipe(instance, **kwargs):
+    change_recipes_count(instance.author_id, -1)
+
+
+@receiver(post_save, sender=Favorites)
+@receiver(post_save, sender=MyShoppingCart)
+def count_added_recipe(sender, instance, created, **kwargs):
+    """ Рецепт добавлен в избранное или корзину. """
+    if created:
+        add(Recipe.objects.filter(id=instance.recipe_id),
+            RECIPE_COUNTERS[sender], 1,
+            popularity=added(sender, instance.created))
+
+
+@receiver(post_delete, sender=Favorites)
+@receiver(post_delete, sender=MyShoppingCart)
+def count_removed_recipe(sender, instance, **kwargs):
+    add(Recipe.objects.filter(id=instance.recipe_id),
+        RECIPE_COUNTERS[sender], -1,
+        popularity=removed(sender, instance.created))
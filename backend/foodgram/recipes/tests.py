@@ -0,0 +1,121 @@
+import io
+import tempfile
+from unittest import mock
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from PIL import Image
+from recipes import images, transfer
+from recipes.models import (AuthorStats, Ingredient, Recipe, RecipeIngredient,
+                            User)
+
+
+class AuthorStatsTest(TestCase):
+    """ Счетчик рецептов автора поддерживается сигналами. """
+
+    def create_recipe(self, author, name):
+        return Recipe.objects.create(
+            author=author, name=name, text='Текст',
+            image='recipes/test.png', cooking_time=10)
+
+    def test_recipes_count(self):
+        author = User.objects.create(username='author', email='a@a.ru')
+        recipe = self.create_recipe(author, 'Первый')
+        self.create_recipe(author, 'Второй')
+        self.assertEqual(author.stats.recipes_count, 2)
+        recipe.delete()
+        author.stats.refresh_from_db()
+        self.assertEqual(author.stats.recipes_count, 1)
+
+    def test_delete_author_with_recipes(self):
+        author = User.objects.create(username='author', email='a@a.ru')
+        self.create_recipe(author, 'Первый')
+        self.create_recipe(author, 'Второй')
+        author.delete()
+        self.assertFalse(Recipe.objects.exists())
+        self.assertFalse(AuthorStats.objects.exists())
+
+    def test_delete_recipe_without_stats(self):
+        author = User.objects.create(username='author', email='a@a.ru')
+        recipe = self.create_recipe(author, 'Первый')
+        AuthorStats.objects.all().delete()
+        recipe.delete()
+        self.assertFalse(AuthorStats.objects.exists())
+
+
+class ImageVariantsTest(TestCase):
+    """ Производные картинки запоминаются в рецепте. """
+
+    def test_variants_read_without_storage(self):
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        storage = FileSystemStorage(location=media_root.name)
+        buffer = io.BytesIO()
+        Image.new('RGB', (1600, 1200)).save(buffer, 'JPEG')
+        name = storage.save('recipes/test.jpg', ContentFile(buffer.getvalue()))
+        author = User.objects.create(username='author', email='a@a.ru')
+        with override_settings(MEDIA_ROOT=media_root.name), \
+                mock.patch.object(images, 'schedule_derivatives'):
+            recipe = Recipe.objects.create(
+                author=author, name='Рецепт', text='Текст',
+                image=name, cooking_time=10)
+        images.create_derivatives(name, storage)
+        images.save_variants(name, (recipe.id, ))
+        recipe.refresh_from_db()
+        with mock.patch.object(storage, 'exists') as exists:
+            variants = images.get_variants(recipe, storage)
+        exists.assert_not_called()
+        self.assertEqual(variants.keys(), images.VARIANTS.keys())
+        recipe.image.name = 'recipes/other.jpg'
+        self.assertEqual(images.get_variants(recipe, storage), {})
+
+
+class RecipeAdminTest(TestCase):
+    """ Страница рецепта в админке не делает запрос на каждую строку. """
+
+    def test_ingredient_queries(self):
+        admin = User.objects.create_superuser(
+            username='admin', email='admin@a.ru', password='admin')
+        recipe = Recipe.objects.create(
+            author=admin, name='Рецепт', text='Текст',
+            image='recipes/test.png', cooking_time=10)
+        RecipeIngredient.objects.bulk_create(
+            RecipeIngredient(
+                recipe=recipe, amount=1,
+                ingredient=Ingredient.objects.create(
+                    name=f'Ингредиент {number}', measurement_unit='г'))
+            for number in range(10))
+        self.client.force_login(admin)
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(
+                f'/admin/recipes/recipe/{recipe.id}/change/')
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Ингредиент 9')
+        self.assertLessEqual(sum(
+            'FROM "recipes_ingredient"' in query['sql']
+            for query in context.captured_queries), 1)
+
+
+class ImportImagesTest(TestCase):
+    """ Импорт запускает производные картинок новых рецептов. """
+
+    def test_import_schedules_derivatives(self):
+        User.objects.create(username='author', email='a@a.ru')
+        records = [
+            {'author': 'author', 'name': name, 'text': 'Текст',
+             'cooking_time': 10, 'image': 'recipes/import.png',
+             'tags': [], 'ingredients': []}
+            for name in ('Первый', 'Второй')]
+        missing = mock.patch.object(
+            images, 'has_derivatives', return_value=False)
+        with missing, mock.patch.object(
+                images, 'schedule_derivatives') as schedule:
+            with self.captureOnCommitCallbacks(execute=True):
+                created, errors = transfer.import_batch(records)
+        self.assertEqual((created, errors), (2, []))
+        schedule.assert_called_once_with(
+            'recipes/import.png',
+            sorted(Recipe.objects.values_list('id', flat=True)))
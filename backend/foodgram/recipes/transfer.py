@@ -0,0 +1,151 @@
+import json
+from collections import defaultdict
+from itertools import islice
+
+from django.db import transaction
+from recipes.images import derive_images
+from recipes.models import Ingredient, Recipe, RecipeIngredient, Tag, User
+
+CHUNK_SIZE = 500
+
+
+def batches(iterable, size):
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+def to_record(recipe):
+    """
+    Рецепт со ссылками по естественным ключам: автор по username,
+    теги по slug, ингредиенты по названию и единице измерения.
+    """
+    return {
+        'id': recipe.id,
+        'author': recipe.author.username,
+        'name': recipe.name,
+        'text': recipe.text,
+        'cooking_time': recipe.cooking_time,
+        'image': recipe.image.name,
+        'tags': [tag.slug for tag in recipe.tags.all()],
+        'ingredients': [
+            {'name': recipe_ingredient.ingredient.name,
+             'measurement_unit': recipe_ingredient.ingredient.measurement_unit,
+             'amount': recipe_ingredient.amount}
+            for recipe_ingredient in recipe.recipe_ingredients.all()],
+    }
+
+
+def export_recipes(chunk_size=CHUNK_SIZE):
+    """
+    Рецепты в NDJSON пачками по возрастанию id,
+    в памяти одновременно не больше одной пачки.
+    """
+    last_id = 0
+    while True:
+        recipes = list(Recipe.objects.filter(id__gt=last_id).select_related(
+            'author').prefetch_related(
+            'tags', 'recipe_ingredients__ingredient').order_by('id')[
+            :chunk_size])
+        if not recipes:
+            return
+        yield ''.join(
+            json.dumps(to_record(recipe), ensure_ascii=False) + '\n'
+            for recipe in recipes)
+        last_id = recipes[-1].id
+
+
+def get_ingredient_ids(records):
+    """ Id ингредиентов пачки, недостающие ингредиенты создаются. """
+    keys = {
+        (ingredient['name'], ingredient['measurement_unit'])
+        for record in records for ingredient in record['ingredients']}
+
+    def load():
+        return {
+            (name, measurement_unit): id
+            for id, name, measurement_unit in Ingredient.objects.filter(
+                name__in={name for name, _ in keys}).order_by('-id')
+            .values_list('id', 'name', 'measurement_unit')}
+
+    ingredient_ids = load()
+    missing = keys - ingredient_ids.keys()
+    if missing:
+        Ingredient.objects.bulk_create(
+            (Ingredient(name=name, measurement_unit=measurement_unit)
+             for name, measurement_unit in missing),
+            ignore_conflicts=True)
+        ingredient_ids = load()
+    return ingredient_ids
+
+
+def import_batch(records):
+    """
+    Пачка рецептов в одной транзакции. Рецепты, которые уже есть
+    у автора, пропускаются. bulk_create не отправляет сигналы,
+    поэтому производные картинок запускаются после коммита здесь.
+    Возвращает число созданных и ошибки.
+    """
+    errors = []
+    with transaction.atomic():
+        authors = User.objects.in_bulk(
+            {record['author'] for record in records},
+            field_name='username')
+        tags = Tag.objects.in_bulk(
+            {slug for record in records for slug in record['tags']},
+            field_name='slug')
+        existing = set(Recipe.objects.filter(
+            author__in=authors.values(),
+            name__in={record['name'] for record in records},
+        ).values_list('author__username', 'name'))
+        new = []
+        for record in records:
+            if (record['author'], record['name']) in existing:
+                continue
+            if record['author'] not in authors:
+                errors.append(
+                    f'{record["name"]}: unknown author {record["author"]}')
+                continue
+            unknown = [slug for slug in record['tags'] if slug not in tags]
+            if unknown:
+                errors.append(f'{record["name"]}: unknown tags {unknown}')
+                continue
+            existing.add((record['author'], record['name']))
+            new.append(record)
+        if not new:
+            return 0, errors
+
+        ingredient_ids = get_ingredient_ids(new)
+        Recipe.objects.bulk_create(
+            Recipe(author=authors[record['author']], name=record['name'],
+                   text=record['text'], image=record['image'],
+                   cooking_time=record['cooking_time'])
+            for record in new)
+        recipe_ids = {
+            (username, name): id
+            for id, username, name in Recipe.objects.filter(
+                author__in=authors.values(),
+                name__in={record['name'] for record in new},
+            ).values_list('id', 'author__username', 'name')}
+        recipe_tags = []
+        recipe_ingredients = []
+        recipes_by_image = defaultdict(list)
+        for record in new:
+            recipe_id = recipe_ids[record['author'], record['name']]
+            if record['image']:
+                recipes_by_image[record['image']].append(recipe_id)
+            recipe_tags.extend(
+                Recipe.tags.through(recipe_id=recipe_id, tag_id=tags[slug].id)
+                for slug in record['tags'])
+            recipe_ingredients.extend(
+                RecipeIngredient(
+                    recipe_id=recipe_id,
+                    ingredient_id=ingredient_ids[
+                        ingredient['name'], ingredient['measurement_unit']],
+                    amount=ingredient['amount'])
+                for ingredient in record['ingredients'])
+        Recipe.tags.through.objects.bulk_create(
+            recipe_tags, ignore_conflicts=True)
+        RecipeIngredient.objects.bulk_create(recipe_ingredients)
+        transaction.on_commit(lambda: derive_images(recipes_by_image))
+    return len(new), errors